@@ -31,21 +31,215 @@ except:
 print("In a notebook: ", is_notebook)
 
 # %%
+import argparse
+import json
 import os
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description="Parse Mimsy measurements for Qi")
+
+
+def input_file(value: str) -> Path:
+    path = Path(value)
+    if path.suffix.lower() not in [".parquet", ".csv", ".jsonl", ".ndjson"]:
+        raise argparse.ArgumentTypeError(
+            f"{value} is not a .parquet, .csv or .jsonl file"
+        )
+    return path
 
-import oracledb
 
-mimsy = oracledb.connect(
-    dsn=f"{os.environ["MIMSY_HOST"]}:{os.environ["MIMSY_PORT"]}/{os.environ["MIMSY_SERVICE"]}",
-    user=os.environ["MIMSY_USERNAME"],
-    password=os.environ["MIMSY_PASSWORD"],
-    tcp_connect_timeout=5.0,
+parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=1000,
+    help="records fetched, parsed and written to parquet at a time",
+)
+parser.add_argument(
+    "--arraysize",
+    type=int,
+    default=1000,
+    help="rows Oracle sends per network round trip",
+)
+parser.add_argument(
+    "--prefetch-rows",
+    type=int,
+    default=1000,
+    help="rows Oracle sends back with the query itself",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="parse in this many processes, 1 parses in the main process",
+)
+parser.add_argument(
+    "--chunk-size",
+    type=int,
+    default=100,
+    help="records sent to a worker process at a time",
+)
+parser.add_argument(
+    "--cache-size",
+    type=int,
+    default=100_000,
+    help="distinct measurement strings to keep parsed in memory",
+)
+parser.add_argument(
+    "--cache-file",
+    type=Path,
+    default=None,
+    help="sqlite file to keep parsed strings in between runs",
+)
+parser.add_argument(
+    "--resume",
+    type=Path,
+    default=None,
+    metavar="DIR",
+    help="continue an interrupted export in this output directory",
+)
+parser.add_argument(
+    "--previous",
+    type=Path,
+    default=None,
+    metavar="DIR",
+    help="only parse records whose MEASUREMENTS changed since the export in DIR",
+)
+parser.add_argument(
+    "--packrat",
+    type=int,
+    nargs="?",
+    const=128,
+    default=None,
+    metavar="CACHE_SIZE",
+    help="memoize the grammars with pyparsing's packrat cache, 0 is unbounded",
 )
-mimsy.is_healthy()
+parser.add_argument(
+    "--fast-path",
+    choices=["on", "off", "check"],
+    default="on",
+    help="parse common shapes with a regex first, check compares it to the grammar",
+)
+parser.add_argument(
+    "--compiled",
+    choices=["on", "off", "check"],
+    default="on",
+    help="parse with mimsy_string written out by hand, check compares it to the grammar",
+)
+parser.add_argument(
+    "--queue-depth",
+    type=int,
+    default=2,
+    help="batches fetching and parsing may run ahead of the stage after them",
+)
+parser.add_argument(
+    "--report-format",
+    choices=["csv", "parquet"],
+    default="csv",
+    help="format of the error, anomaly, result and summary reports",
+)
+parser.add_argument(
+    "--qi-csv",
+    action="store_true",
+    help="also write the results that could be normalized as a CSV to import into Qi",
+)
+parser.add_argument(
+    "--partitions",
+    type=int,
+    default=1,
+    help="split the M_IDs into this many ranges, each fetched over its own connection",
+)
+parser.add_argument(
+    "--input",
+    type=input_file,
+    nargs="+",
+    default=None,
+    metavar="FILE",
+    help="read M_ID and MEASUREMENTS from these files instead of Mimsy",
+)
+parser.add_argument(
+    "--progress",
+    type=float,
+    nargs="?",
+    const=10.0,
+    default=None,
+    metavar="SECONDS",
+    help="print records done, records/s and the time left this often",
+)
+parser.add_argument(
+    "--slowest",
+    type=int,
+    default=20,
+    help="slowest strings to list in metrics.json with their M_ID",
+)
+parser.add_argument(
+    "--profile-every",
+    type=int,
+    default=None,
+    metavar="N",
+    help="profile parsing every Nth batch with cProfile, into profile.pstats",
+)
+parser.add_argument(
+    "--time-budget",
+    type=float,
+    default=1.0,
+    metavar="SECONDS",
+    help="give up parsing a string after this long, as a Parse Timeout, 0 never does",
+)
+parser.add_argument(
+    "--max-length",
+    type=int,
+    default=2000,
+    help="longer strings are a Parse Timeout without being parsed, 0 for any length",
+)
+args = parser.parse_args([] if is_notebook else None)
+if is_notebook:
+    print(args)
+
+# An export is resumed from the input it was started with, which is
+# checked before anything connects to Mimsy
+inputs = None if args.input is None else [str(path) for path in args.input]
+if args.resume is not None:
+    resumed_input = json.loads((args.resume / "manifest.json").read_text()).get("input")
+    if resumed_input != inputs:
+        parser.error(
+            f"{args.resume} was exported from {resumed_input or 'Mimsy'},"
+            " resume it from the same input"
+        )
+
+# %%
+import oracledb
+
+# Nothing connects to Mimsy when the records are read from --input files
+mimsy = None
+if args.input is None:
+    mimsy_params = dict(
+        dsn=f"{os.environ["MIMSY_HOST"]}:{os.environ["MIMSY_PORT"]}/{os.environ["MIMSY_SERVICE"]}",
+        user=os.environ["MIMSY_USERNAME"],
+        password=os.environ["MIMSY_PASSWORD"],
+        tcp_connect_timeout=5.0,
+    )
+    mimsy = oracledb.connect(**mimsy_params)
+    mimsy.is_healthy()
 
 # %%
 # query = "SELECT M_ID, MEASUREMENTS FROM CATALOGUE WHERE MEASUREMENTS IS NOT NULL FETCH NEXT 10 ROWS ONLY"
 query = "SELECT M_ID, MEASUREMENTS FROM CATALOGUE WHERE M_ID > {0} AND MEASUREMENTS IS NOT NULL ORDER BY M_ID ASC"
+range_query = "SELECT M_ID, MEASUREMENTS FROM CATALOGUE WHERE M_ID > {0} AND M_ID <= {1} AND MEASUREMENTS IS NOT NULL ORDER BY M_ID ASC"
+count_query = (
+    "SELECT COUNT(*) FROM CATALOGUE WHERE M_ID > {0} AND MEASUREMENTS IS NOT NULL"
+)
+range_count_query = "SELECT COUNT(*) FROM CATALOGUE WHERE M_ID > {0} AND M_ID <= {1} AND MEASUREMENTS IS NOT NULL"
+# NTILE splits the records into ranges of about the same size,
+# however unevenly the M_IDs are spread out.
+partitions_query = """
+SELECT MIN(M_ID), MAX(M_ID)
+FROM (
+    SELECT M_ID, NTILE({0}) OVER (ORDER BY M_ID) AS TILE
+    FROM CATALOGUE
+    WHERE MEASUREMENTS IS NOT NULL
+)
+GROUP BY TILE
+ORDER BY 1"""
 '''
 query = """
 SELECT
@@ -108,18 +302,151 @@ ORDER BY M_ID ASC"""
 '''
 
 # %%
+import threading
+from time import perf_counter
+
 import polars as pl
 
 
-def measurements(last=0):
-    return pl.read_database(
-        connection=mimsy, query=query.format(last), iter_batches=True, batch_size=1000
+def fetch_lobs_as_strings(cursor, metadata):
+    # MEASUREMENTS is a CLOB, fetching it as a LONG string skips a round
+    # trip per row to read each LOB locator.
+    if metadata.type_code is oracledb.DB_TYPE_CLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+
+
+fetch_stats = {"rows": 0, "batches": 0, "seconds": 0.0}
+fetch_stats_lock = threading.Lock()
+
+
+def measurements(last=-1, high=None, connection=None):
+    """(M_ID, MEASUREMENTS) tuples after the last M_ID, a batch at a time.
+
+    With a high M_ID only the records up to and including it are fetched.
+    """
+    with (connection or mimsy).cursor() as cursor:
+        cursor.arraysize = args.arraysize
+        cursor.prefetchrows = args.prefetch_rows
+        cursor.outputtypehandler = fetch_lobs_as_strings
+        start = perf_counter()
+        cursor.execute(
+            query.format(last) if high is None else range_query.format(last, high)
+        )
+        while True:
+            batch = cursor.fetchmany(args.batch_size)
+            with fetch_stats_lock:
+                fetch_stats["seconds"] += perf_counter() - start
+                if batch:
+                    fetch_stats["rows"] += len(batch)
+                    fetch_stats["batches"] += 1
+            if not batch:
+                return
+            yield batch
+            start = perf_counter()
+
+
+def record_count(last=-1, high=None, connection=None) -> int:
+    """How many records measurements() would fetch."""
+    with (connection or mimsy).cursor() as cursor:
+        cursor.execute(
+            count_query.format(last)
+            if high is None
+            else range_count_query.format(last, high)
+        )
+        return cursor.fetchone()[0]
+
+
+def round_trips(connection=None) -> int | None:
+    """The session's round trips to Oracle so far, if we can see v$mystat."""
+    if (connection or mimsy) is None:
+        return None
+    try:
+        with (connection or mimsy).cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT s.value
+                FROM v$mystat s
+                JOIN v$statname n ON n.statistic# = s.statistic#
+                WHERE n.name = 'SQL*Net roundtrips to/from client'"""
+            )
+            return cursor.fetchone()[0]
+    except oracledb.DatabaseError:
+        return None
+
+
+# A dump of CATALOGUE, read lazily so only the two columns are loaded and
+# parquet files are memory-mapped rather than read in whole.
+input_scans = {
+    ".parquet": pl.scan_parquet,
+    ".csv": lambda path: pl.scan_csv(path, infer_schema=False),
+    ".jsonl": pl.scan_ndjson,
+    ".ndjson": pl.scan_ndjson,
+}
+
+
+def input_records() -> pl.LazyFrame:
+    """The records in the --input files that have MEASUREMENTS, by M_ID."""
+    return (
+        pl.concat(
+            input_scans[path.suffix.lower()](path).select(
+                pl.col("M_ID").cast(pl.Int64),
+                pl.col("MEASUREMENTS").cast(pl.String),
+            )
+            for path in args.input
+        )
+        .filter(pl.col("MEASUREMENTS").is_not_null())
+        .sort("M_ID")
+    )
+
+
+def input_measurements(last=-1, high=None):
+    """measurements(), but from the --input files."""
+    start = perf_counter()
+    records = input_records().filter(pl.col("M_ID") > last)
+    if high is not None:
+        records = records.filter(pl.col("M_ID") <= high)
+    for batch in records.collect().iter_slices(args.batch_size):
+        batch = batch.rows()
+        with fetch_stats_lock:
+            fetch_stats["seconds"] += perf_counter() - start
+            fetch_stats["rows"] += len(batch)
+            fetch_stats["batches"] += 1
+        yield batch
+        start = perf_counter()
+
+
+def input_count(last=-1, high=None) -> int:
+    """record_count(), but over the --input files."""
+    records = input_records().filter(pl.col("M_ID") > last)
+    if high is not None:
+        records = records.filter(pl.col("M_ID") <= high)
+    return records.select(pl.len()).collect().item()
+
+
+def input_partitions(count: int) -> list[tuple[int, int]]:
+    """partitions_query, but over the --input files."""
+    return (
+        input_records()
+        .select(
+            "M_ID",
+            (pl.int_range(pl.len()) * count // pl.len()).alias("TILE"),
+        )
+        .group_by("TILE")
+        .agg(pl.col("M_ID").min().alias("low"), pl.col("M_ID").max().alias("high"))
+        .sort("TILE")
+        .select("low", "high")
+        .collect()
+        .rows()
     )
 
 
 # %%
 if is_notebook:
-    ms = pl.concat(list(measurements())).to_dicts()
+    ms = [
+        {"M_ID": m_id, "MEASUREMENTS": text}
+        for batch in measurements()
+        for (m_id, text) in batch
+    ]
     tests = """
     (ok, res) = mimsy_string.run_tests('''"""
     for m in ms:
@@ -136,64 +463,20 @@ if is_notebook:
 # %%
 import pyparsing as pp
 
-
-# This is bad. I don't quite know how to not parse the xs with the dim.
-# but it works...
-def extra_x_strip(t):
-    t = str.strip(t)
-    if t.endswith(" x"):
-        t = t[:-2]
-    if t.endswith(" ×"):
-        t = t[:-2]
-    if t.endswith("/"):
-        t = t[:-1]
-    return str.strip(t)
-
-
-dim = pp.Group(
-    pp.Word(
-        pp.nums + "." + "/" + " " + "½" + "¼" + "¾" + "⅛" + "⅜" + "⅝" + "⅞" + "-" + "×"
-    ).set_parse_action(pp.token_map(extra_x_strip))("value")
-    + pp.Optional(
-        pp.oneOf(
-            [
-                "in",
-                '"',
-                "inches",
-                "ft",
-                "'",
-                "cm",
-                "m",
-                "mm",
-                "g",
-                "gm",
-                "lbs",
-                "deg",
-                "minutes",
-                "seconds",
-                "pages",
-            ]
-        )("unit")
-        + pp.Optional(".")
-        + pp.Optional(
-            pp.Optional(
-                pp.Combine(
-                    pp.Suppress("(")
-                    + pp.Word(pp.alphas + "." + " " + "[" + "]" + ",").set_parse_action(
-                        pp.token_map(str.strip)
-                    )
-                    + pp.Suppress(")")
-                )
-            )
-            + pp.Optional(
-                pp.Word(pp.alphas + " ", min=3).set_parse_action(
-                    pp.token_map(extra_x_strip)
-                )
-            )
-        )("context")
-    )
+from mimsy_measurements import (
+    configure_packrat,
+    dieaxis_string,
+    dim,
+    dimensions,
+    hdf_dimensions,
+    hdf_string,
+    mimsy_string,
+    parenthetical_string,
+    straight_string,
 )
 
+configure_packrat(args.packrat)
+
 if is_notebook:
     debug = False
     (ok, res) = dim.run_tests(
@@ -234,54 +517,6 @@ if is_notebook:
     debug = False
     print("Success!" if ok and not debug else res)
 
-vol = pp.Group(
-    pp.OneOrMore(
-        pp.Optional(pp.Suppress(pp.Word("x", "×")))
-        + pp.Optional(pp.Suppress(","))
-        + dim("dimensions*")
-        + pp.Optional(pp.Suppress(pp.Word("x", "×")))
-    )
-)
-
-
-dimensions = pp.Group(
-    pp.Optional(
-        pp.Group(
-            pp.Optional(
-                pp.Combine(
-                    pp.Suppress("(")
-                    + pp.Word(
-                        pp.alphanums + pp.alphas8bit + "/" + "-" + "." + ";" + "&" + " "
-                    ).set_parse_action(pp.token_map(str.strip))
-                    + pp.Suppress(")")
-                )
-            )
-            + pp.Word(
-                pp.alphas + pp.alphas8bit + "/" + "-" + "&" + "?" + "'" + "#" + " "
-            ).set_parse_action(pp.token_map(str.strip))
-            + pp.Optional(pp.Suppress(";") + pp.Word(pp.alphas + pp.alphas8bit + "-"))
-            + pp.Optional(
-                pp.Suppress(",")
-                + pp.Word(pp.alphas + pp.alphas8bit + "/" + "," + " ").set_parse_action(
-                    pp.token_map(str.strip)
-                )
-            )
-            + pp.Optional(
-                pp.Combine(
-                    pp.Suppress("(")
-                    + pp.Word(
-                        pp.alphanums + pp.alphas8bit + "/" + "-" + "." + ";" + "&" + " "
-                    ).set_parse_action(pp.token_map(str.strip))
-                    + pp.Suppress(")")
-                )
-            )
-        )("type")
-    )
-    + pp.Suppress(pp.ZeroOrMore(":"))
-    + pp.OneOrMore(vol("measurements*") + pp.Suppress(pp.ZeroOrMore(";")))
-)
-
-if is_notebook:
     (ok, res) = dimensions.run_tests(
         [
             "Overall: 5 3/4 in x 12 1/4 in x 9 1/8 in; 14.6 cm x 31.1 cm x 23.2 cm",
@@ -324,36 +559,6 @@ if is_notebook:
     debug = False
     print("Success!" if ok and not debug else res)
 
-mimsy_string = (
-    pp.OneOrMore(dimensions("facets*"))
-    + pp.Suppress(pp.Optional("cm"))
-    + pp.Suppress(pp.Optional("Image:"))
-)
-
-dieaxis_string = pp.Group(
-    pp.Empty().addParseAction(pp.replace_with(["diexis"]))("type")
-    + pp.Group(dim("dimensions*"))("measurements*")
-    + pp.Suppress(";")
-    + pp.Group(dim("dimensions*"))("measurements*")
-    + pp.Suppress(",")
-    + pp.Suppress(pp.Literal("weight"))
-    + pp.Group(dim("dimensions*"))("measurements*")
-    + pp.Suppress(",")
-    + pp.Group(
-        pp.Suppress(
-            pp.Combine(
-                pp.Literal("die")
-                + pp.Optional(pp.Suppress(pp.White() + pp.Char("a")))
-                + pp.Literal("xis")
-                + pp.Optional(pp.Suppress(";"))
-            )
-        )
-        + dim("dimensions*")
-    )("measurements*")
-)("facets*")
-
-
-if is_notebook:
     dieaxis_tests = [
         "5/8 in. diameter; 1.5875 cm, weight 3.8 gm., diexis 0",
         "2 1/16 in. diameter; 5.2388 cm, weight 137.7 gm., die axis; 0 deg.",
@@ -375,13 +580,6 @@ if is_notebook:
     debug = False
     print("Success!" if ok and not debug else res)
 
-hdf_dimensions = pp.Group(
-    pp.Group(pp.Word(pp.alphas))("type")
-    + pp.Suppress(pp.Optional(":") + pp.Optional("-"))
-    + pp.OneOrMore(vol("measurements*") + pp.Suppress(pp.Optional(";")))
-)
-
-if is_notebook:
     hdf_tests = [
         "teacup - 1 3/4 in x 2 15/16 in; 4.445 cm x 7.46125 cm",
         "saucer: 1 in x 4 3/4 in",
@@ -397,23 +595,6 @@ if is_notebook:
     debug = False
     print("Success!" if ok and not debug else res)
 
-hdf_string = pp.Suppress(pp.CaselessLiteral("overall:")) + pp.OneOrMore(
-    hdf_dimensions("facets*")
-)
-
-parenthetical_string = pp.Group(
-    pp.Optional(pp.Word(pp.alphas)("type*") + pp.Suppress(":"))
-    + vol("measurements*")
-    + pp.Suppress(pp.Optional("/"))
-    + pp.Suppress("(")
-    + pp.Optional(pp.Word(pp.alphas)("type*"))
-    + vol("measurements*")
-    + pp.Optional(pp.Word(pp.alphas)("type*"))
-    + pp.Suppress(")")
-)("facets*")
-
-
-if is_notebook:
     parenthetical_tests = [
         '11-1/4" x 13-3/4" / (frame 22-1/2" x 25")',
         '17-1/2" x 23-1/2" / (25" x 30-3/4" framed)',
@@ -431,35 +612,6 @@ if is_notebook:
     debug = False
     print("Success!" if ok and not debug else res)
 
-straight_string = pp.Group(
-    pp.Group(
-        pp.Group(
-            pp.Word(pp.nums + " " + "/").add_parse_action(pp.token_map(str.strip))(
-                "value"
-            )
-            + pp.Char('"')("unit")
-            + pp.Or([pp.Char("h"), pp.Char("H")])("context")
-        )("dimensions*")
-        + pp.Suppress("x")
-        + pp.Group(
-            pp.Word(pp.nums + " " + "/").add_parse_action(pp.token_map(str.strip))(
-                "value"
-            )
-            + pp.Char('"')("unit")
-            + pp.Or([pp.Char("w"), pp.Char("W")])("context")
-        )("dimensions*")
-        + pp.Suppress("x")
-        + pp.Group(
-            pp.Word(pp.nums + " " + "/").add_parse_action(pp.token_map(str.strip))(
-                "value"
-            )
-            + pp.Char('"')("unit")
-            + pp.Or([pp.Char("d"), pp.Char("D")])("context")
-        )("dimensions*")
-    )("measurements*")
-)("facets*")
-
-if is_notebook:
     straight_tests = [
         '40 1/2" H x 18 1/2" W x 15" D',
         '73" H x 40" W x 20" D',
@@ -474,7 +626,6 @@ if is_notebook:
     debug = False
     print("Success!" if ok and not debug else res)
 
-if is_notebook:
     mimsy_string.create_diagram("default_parser.html", show_results_names=True)
     dieaxis_string.create_diagram("die-axis_parser.html", show_results_names=True)
     hdf_string.create_diagram("historic-deerfield_parser.html", show_results_names=True)
@@ -512,6 +663,7 @@ if is_notebook:
     print(ex)
     print(ex.as_dict())
 
+
 # %%
 if is_notebook:
     (ok, res) = mimsy_string.run_tests(
@@ -721,156 +873,1100 @@ if is_notebook:
     print("Success!" if ok else res)
 
 # %%
-from copy import deepcopy
-from datetime import datetime
-from pathlib import Path
+from mimsy_measurements import facets_to_arrow
 
-last = 0
-output = Path("output", datetime.now().strftime("%m%d%H%M%S"))
-output.mkdir(parents=True, exist_ok=False)
-for batch_no, batch in enumerate(measurements(last - 1)):
-    if is_notebook:
-        print(f"{batch_no}...")
+if is_notebook:
+    ex = list(
+        mimsy_string.parse_string(
+            "Overall: 6 in (height), 2 1/8 in (bowl diameter), 3 1/8 in (foot diameter); 15.2 cm (height), 5.4 cm (bowl diameter), 7.9 (foot diameter)"
+        )
+    )
+    print(ex)
+    print(facets_to_arrow([ex]))
+
+
+# %%
+from mimsy_measurements import fast_path
 
-    results = []
-    for item in batch.to_dicts():
-        base_res = {"M_ID": item["M_ID"], "MEASUREMENTS": item["MEASUREMENTS"]}
+if is_notebook:
+    for test in [
+        "Overall: 5 3/4 in x 12 1/4 in x 9 1/8 in; 14.6 cm x 31.1 cm x 23.2 cm",
+        "sheet: 16 x 19 15/16 in.; 40.64 x 50.6413 cm; image: 12 x 17 1/2 in.; 30.48 x 44.45 cm",
+        "10 x 8 3/4 in.; 25.4 x 22.225 cm",
+        "1/16 x 3/4 in. irregular diameter; .1588 x 1.905 cm",
+    ]:
+        print(fast_path(test))
+
+# %%
+from mimsy_measurements import compare_compiled, compiled_mimsy
 
-        (mimsy_ok, err) = mimsy_string.run_tests(
-            item["MEASUREMENTS"], print_results=False, full_dump=False
+if is_notebook:
+    print(
+        compiled_mimsy(
+            "Overall: 6 in (height), 2 1/8 in (bowl diameter); 15.2 cm (height), 5.4 cm (bowl diameter)"
         )
+    )
+    mismatches = compare_compiled([m["MEASUREMENTS"] for m in ms])
+    print(f"{len(mismatches)} differences between the compiled parser and mimsy_string")
+    for mismatch in mismatches[:10]:
+        print(mismatch)
+
+# %%
+from mimsy_measurements import dispatch, grammar_stats, merge_stats
 
-        dieaxis_ok = False
-        if not mimsy_ok:
-            (dieaxis_ok, _) = dieaxis_string.run_tests(
-                item["MEASUREMENTS"], print_results=False, full_dump=False
+if is_notebook:
+    for test in [
+        "Overall: 9 in; 22.9 cm",
+        "5/8 in. diameter; 1.5875 cm, weight 3.8 gm., diexis 0",
+        "overall: cup - 1 1/2 x 2 15/16 in.; saucer - 7/8 x 4 5/8 in.",
+        "13 3/4 x 19 3/4 in (34.925 x 50.165 cm)",
+        '73" H x 40" W x 20" D',
+        "not a measurement",
+    ]:
+        print(dispatch(test)[::2])
+
+# %%
+import random
+
+if is_notebook:
+    random.seed(0)
+    sample = random.sample([m["MEASUREMENTS"] for m in ms], min(len(ms), 2000))
+    for label, cache_size in [
+        ("no packrat", None),
+        ("packrat, 128", 128),
+        ("packrat, unbounded", 0),
+    ]:
+        configure_packrat(cache_size)
+        start = perf_counter()
+        for text in sample:
+            dispatch(text, use_fast_path=False, use_compiled=False)
+        print(f"{label}: {len(sample) / (perf_counter() - start):.0f} strings/s")
+    configure_packrat(args.packrat)
+
+# %%
+# Batches are built separately, so their categoricals need the same cache
+# to be concatenated and written as one dataset.
+pl.enable_string_cache()
+
+from mimsy_measurements import (
+    chunked,
+    compare_fast_path,
+    parse_chunk,
+    rows_frame,
+    schema,
+)
+
+
+# %%
+from mimsy_measurements import normalize
+
+if is_notebook:
+    print(
+        normalize(
+            rows_frame(
+                [
+                    (0, "", None, "mimsy", None, False, False, False, False, 0, 0, None)
+                    + (None, units)
+                    + (None, a, None, b)
+                    + (None,) * 6
+                    for (units, a, b) in [
+                        ("in", "5 3/4", "15/16"),
+                        ("in", "19 ½", ".5"),
+                        ("cm", "14.6", None),
+                        ('"', "11-1/4", "½"),
+                        ("lbs", "50", None),
+                        ("minutes", "2", None),
+                        ("", "3", None),
+                        ("in, cm", "4", "5"),
+                        ("in", "5-6", None),
+                    ]
+                ]
             )
+        ).select(
+            "Units",
+            "Dimension1 Value",
+            "Dimension2 Value",
+            "Normalized Units",
+            "Dimension1 Value (normalized)",
+            "Dimension2 Value (normalized)",
+            "Normalization Failed",
+        )
+    )
+
+
+# %%
+if is_notebook:
+    mismatches = compare_fast_path([m["MEASUREMENTS"] for m in ms])
+    print(f"{len(mismatches)} differences between the fast path and mimsy_string")
+    for mismatch in mismatches[:10]:
+        print(mismatch)
+
+# %%
+from mimsy_measurements import clean_strings
+
+# Strings are parsed, and their rows cached, as they are once cleaned
+if is_notebook:
+    texts = [m["MEASUREMENTS"] for m in ms]
+    print(
+        f"{len(set(texts))} distinct strings, {len(set(clean_strings(texts)))} once cleaned"
+    )
+    for text in ["9 ½ × 3 in (24.1 × 7.6 cm)", "Overall:  9\t1/2 in x 3 in;"]:
+        print(repr(text), "->", repr(clean_strings([text])[0]))
+
+# %%
+import json
+import sqlite3
+from collections import OrderedDict
+
+
+class ParseCache:
+    """Parsed (grammar, rows) by measurement string, least recently used first out.
+
+    With a path the entries are also kept in a sqlite file so later runs
+    can skip parsing strings they have already seen. The file is emptied
+    when the version it was written with doesn't match. It isn't thread
+    safe, callers sharing it between threads hold a lock around it.
+    """
 
-        hdf_ok = False
-        if not mimsy_ok and not dieaxis_ok:
-            (hdf_ok, _) = hdf_string.run_tests(
-                item["MEASUREMENTS"], print_results=False, full_dump=False
+    def __init__(self, maxsize: int, path: Path | None = None, version: str = ""):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
             )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS parsed (text TEXT PRIMARY KEY, grammar TEXT, rows TEXT)"
+            )
+            stored = self.db.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+            if stored is None or stored[0] != version:
+                self.db.execute("DELETE FROM parsed")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,)
+                )
+                self.db.commit()
+
+    def _remember(self, key: str, entry: tuple):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str) -> tuple | None:
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT grammar, rows FROM parsed WHERE text = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                entry = (row[0], json.loads(row[1]))
+                self._remember(key, entry)
+                return entry
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, entry: tuple):
+        self._remember(key, entry)
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO parsed VALUES (?, ?, ?)",
+                (key, entry[0], json.dumps(entry[1])),
+            )
+
+    def commit(self):
+        if self.db is not None:
+            self.db.commit()
+
+
+# %%
+import queue
+from collections.abc import Callable, Generator
+from datetime import timedelta
+
+# Fetching waits on Oracle, parsing on the CPU and writing on the disk, so
+# each stage runs in its own thread with a bounded queue in between. A stage
+# that falls behind makes the one before it wait rather than fill memory.
+# Flattening and building the batch DataFrame are timed within parsing.
+# Flattening is done in the worker processes, so its seconds are added up
+# over them and are CPU time rather than time the export took.
+stage_stats = {
+    name: {"batches": 0, "rows": 0, "seconds": 0.0, "waiting": 0, "most_waiting": 0}
+    for name in ["fetch", "parse", "flatten", "frame", "write"]
+}
+stage_stats_lock = threading.Lock()
+
+
+def record_stage(name: str, rows: int, seconds: float, waiting: int = 0):
+    """Count a batch through a stage, and how many more were queued for it."""
+    with stage_stats_lock:
+        stats = stage_stats[name]
+        stats["batches"] += 1
+        stats["rows"] += rows
+        stats["seconds"] += seconds
+        stats["waiting"] += waiting
+        stats["most_waiting"] = max(stats["most_waiting"], waiting)
+
+
+done = object()
+
+
+class Fetcher(threading.Thread):
+    """Runs a generator of batches in its own thread, up to depth batches ahead."""
+
+    def __init__(self, batches: Generator, depth: int):
+        super().__init__(daemon=True)
+        self.batches = batches
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopping = threading.Event()
+        self.finished = False
+        self.fetched = 0
+        self.taken = 0
+
+    def run(self):
+        try:
+            start = perf_counter()
+            for batch in self.batches:
+                record_stage("fetch", len(batch), perf_counter() - start)
+                self.queue.put(batch)
+                self.fetched += 1
+                if self.stopping.is_set():
+                    break
+                start = perf_counter()
+        except Exception as error:
+            self.queue.put(error)
+        finally:
+            self.batches.close()
+            self.queue.put(done)
+
+    def __iter__(self):
+        while (batch := self.queue.get()) is not done:
+            if isinstance(batch, Exception):
+                raise batch
+            self.taken += 1
+            yield batch
+        self.finished = True
+
+    @property
+    def waiting(self) -> int:
+        """Batches fetched and queued for the caller."""
+        return self.fetched - self.taken
+
+    def stop(self):
+        # Take whatever is still queued so a blocked put returns and sees the stop
+        self.stopping.set()
+        while not self.finished:
+            self.finished = self.queue.get() is done
+        self.join()
+
+
+class Writer(threading.Thread):
+    """Calls write on each item put, in order, in its own thread.
+
+    write returns the rows it wrote. An error stops the writing and is
+    raised from the next put or from close.
+    """
+
+    def __init__(self, write: Callable[..., int], depth: int):
+        super().__init__(daemon=True)
+        self.write = write
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self.queued = 0
+        self.taken = 0
+
+    def run(self):
+        while (item := self.queue.get()) is not done:
+            self.taken += 1
+            if self.error is not None:
+                continue
+            waiting = self.queued - self.taken
+            start = perf_counter()
+            try:
+                rows = self.write(*item)
+            except Exception as error:
+                self.error = error
+            else:
+                record_stage("write", rows, perf_counter() - start, waiting)
+
+    def put(self, *item):
+        if self.error is not None:
+            raise self.error
+        self.queued += 1
+        self.queue.put(item)
+
+    def close(self):
+        self.queue.put(done)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class Progress:
+    """Prints the records done, records/s and time left, at most every interval."""
+
+    def __init__(self, total: int | None, interval: float):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.start = self.printed = perf_counter()
+        self.lock = threading.Lock()
+
+    def add(self, records: int):
+        with self.lock:
+            self.done += records
+            now = perf_counter()
+            if now - self.printed < self.interval:
+                return
+            self.printed = now
+            rate = self.done / (now - self.start)
+            line = f"{self.done} records, {rate:.0f} records/s"
+            if self.total:
+                left = timedelta(seconds=round((self.total - self.done) / rate))
+                line += f", {self.done / self.total:.0%} of {self.total}, {left} left"
+            print(line, flush=True)
+
+
+# %%
+import pyarrow.parquet as pq
+
+qi_columns = [
+    "M_ID",
+    "Type",
+    "Type (additional)",
+    "Normalized Units",
+    *(
+        column
+        for n in range(1, 6)
+        for column in (f"Dimension{n} Context", f"Dimension{n} Value (normalized)")
+    ),
+]
+summary_keys = ["Grammar", "Type", "Units"]
+
+
+class Report:
+    """The parse_errors, parse_anomalies and parse_results reports, a batch at a time.
+
+    Every batch written is appended to each report, and counted into a
+    summary by grammar, type and units, so the reports are done as soon
+    as the export is. Errors that were a Parse Timeout are also listed
+    in parse_timeouts by M_ID and length, the strings the grammars are
+    slowest on. With qi the results that could be normalized also go to
+    qi_measurements.csv, ready to import.
+    """
 
-        paren_ok = False
-        if not mimsy_ok and not dieaxis_ok and not hdf_ok:
-            (paren_ok, _) = parenthetical_string.run_tests(
-                item["MEASUREMENTS"], print_results=False, full_dump=False
+    def __init__(self, root: Path, format: str = "csv", qi: bool = False):
+        self.root = root
+        self.format = format
+        self.qi = qi
+        self.writers = {}
+        self.counts = []
+        self.lock = threading.Lock()
+
+    def _write(self, name: str, frame: pl.DataFrame, format: str):
+        if format == "parquet":
+            table = frame.to_arrow()
+            if name not in self.writers:
+                self.writers[name] = pq.ParquetWriter(
+                    self.root / f"{name}.parquet", table.schema
+                )
+            self.writers[name].write_table(table)
+        else:
+            if name not in self.writers:
+                self.writers[name] = open(self.root / f"{name}.csv", "wb")
+                frame.write_csv(self.writers[name])
+            else:
+                frame.write_csv(self.writers[name], include_header=False)
+
+    def add(self, rows: pl.DataFrame):
+        names = [c for (c, _) in schema]
+        rows = rows.with_columns(status).select(*names, pl.exclude(names))
+        flagged = (
+            pl.col("Inconsistent Units")
+            | pl.col("Too Many Dimensions")
+            | pl.col("Missing Units")
+        )
+        results = rows.filter(pl.col("Status") == "ok", flagged.not_()).drop(
+            "Parse Error",
+            "Parse Timeout",
+            "Inconsistent Units",
+            "Too Many Dimensions",
+            "Missing Units",
+        )
+        with self.lock:
+            self._write(
+                "parse_errors", rows.filter(pl.col("Status") == "error"), self.format
+            )
+            self._write(
+                "parse_timeouts",
+                rows.filter(pl.col("Parse Timeout")).select(
+                    "M_ID",
+                    pl.col("MEASUREMENTS").str.len_chars().alias("Length"),
+                    "Parse Error",
+                    "MEASUREMENTS",
+                    "Cleaned MEASUREMENTS",
+                ),
+                self.format,
+            )
+            self._write(
+                "parse_anomalies",
+                rows.filter(pl.col("Status") != "ok", flagged),
+                self.format,
+            )
+            self._write("parse_results", results, self.format)
+            if self.qi:
+                self._write(
+                    "qi_measurements",
+                    results.filter(pl.col("Normalization Failed").not_()).select(
+                        qi_columns
+                    ),
+                    "csv",
+                )
+            self.counts.append(
+                rows.group_by(summary_keys).agg(
+                    pl.len().alias("Rows"),
+                    (pl.col("Status") == "ok").sum().alias("OK"),
+                    (pl.col("Status") == "anomaly").sum().alias("Anomalies"),
+                    (pl.col("Status") == "error").sum().alias("Errors"),
+                    pl.col("Parse Timeout").sum().alias("Timeouts"),
+                )
             )
 
-        straight_ok = False
-        if not mimsy_ok and not dieaxis_ok and not hdf_ok and not paren_ok:
-            (straight_ok, _) = straight_string.run_tests(
-                item["MEASUREMENTS"], print_results=False, full_dump=False
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        if self.counts:
+            summary = (
+                pl.concat(self.counts)
+                .group_by(summary_keys)
+                .agg(pl.all().sum())
+                .sort("Rows", *summary_keys, descending=[True, False, False, False])
             )
+            self.writers = {}
+            self._write("summary", summary, self.format)
+            self.writers["summary"].close()
 
-        if (
-            not mimsy_ok
-            and not dieaxis_ok
-            and not hdf_ok
-            and not paren_ok
-            and not straight_ok
-        ):
-            base_res["Parse Error"] = str(err)
 
-        try:
-            dimensions = (
-                dieaxis_string.parse_string(item["MEASUREMENTS"])
-                if dieaxis_ok
-                else (
-                    hdf_string.parse_string(item["MEASUREMENTS"])
-                    if hdf_ok
-                    else (
-                        parenthetical_string.parse_string(item["MEASUREMENTS"])
-                        if paren_ok
-                        else (
-                            straight_string.parse_string(item["MEASUREMENTS"])
-                            if straight_ok
-                            else mimsy_string.parse_string(item["MEASUREMENTS"])
-                        )
+# %%
+import cProfile
+import hashlib
+import heapq
+import multiprocessing
+import pstats
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+import mimsy_measurements
+
+# Workers are forked so they start with the grammars already built,
+# and the connection and notebook state are never re-imported. They are
+# started here, before the fetch and write threads, as a fork while another
+# thread holds a lock leaves it held for good in the worker.
+pool = None
+if args.workers > 1:
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("fork")
+    )
+    pool.submit(int).result()
+    parse_map = pool.map
+else:
+    parse_map = map
+
+# Cached rows are only good for the parser that produced them, so any edit
+# to the package, or another pyparsing or Polars, starts the cache afresh
+cache = ParseCache(
+    args.cache_size,
+    args.cache_file,
+    version=hashlib.sha1(
+        b"\n".join(
+            [
+                pp.__version__.encode(),
+                pl.__version__.encode(),
+                *(
+                    path.read_bytes()
+                    for path in sorted(
+                        Path(mimsy_measurements.__file__).parent.glob("*.py")
                     )
+                ),
+            ]
+        )
+    ).hexdigest(),
+)
+
+
+def write_atomic(path: Path, write):
+    # A file is only ever seen under its real name once it is complete
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+# Rows are written as a hive partitioned dataset, by the grammar that
+# matched and whether they parsed cleanly, so readers that only want one
+# kind of row skip the files holding the others.
+status = (
+    pl.when(pl.col("Parse Error").is_not_null())
+    .then(pl.lit("error"))
+    .when(
+        pl.col("Inconsistent Units")
+        | pl.col("Too Many Dimensions")
+        | pl.col("Missing Units")
+    )
+    .then(pl.lit("anomaly"))
+    .otherwise(pl.lit("ok"))
+    .alias("Status")
+)
+dataset_files = "Grammar=*/Status=*/*.parquet"
+hive_null = "__HIVE_DEFAULT_PARTITION__"
+
+
+def scan_dataset(path: Path) -> pl.LazyFrame:
+    return pl.scan_parquet(path / dataset_files, hive_partitioning=True)
+
+
+def write_dataset(frame: pl.DataFrame, root: Path, name: str) -> list[str]:
+    """Write a batch as name in each partition it has rows for, returns the files."""
+    files = []
+    for (grammar, status_), rows in (
+        frame.with_columns(status)
+        .partition_by("Grammar", "Status", as_dict=True)
+        .items()
+    ):
+        path = root / f"Grammar={grammar or hive_null}" / f"Status={status_}" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            path,
+            partial(rows.drop("Grammar", "Status").write_parquet, statistics=True),
+        )
+        files.append(str(path.relative_to(output)))
+    return files
+
+
+def read_dataset_file(path: Path) -> pl.DataFrame:
+    """A data file with the Grammar and Status of the partition it is in."""
+    (grammar, status_) = (part.split("=", 1)[1] for part in path.parts[-3:-1])
+    return pl.read_parquet(path).with_columns(
+        pl.lit(None if grammar == hive_null else grammar, pl.String).alias("Grammar"),
+        pl.lit(status_).alias("Status"),
+    )
+
+
+def write_summary(root: Path):
+    """A _metadata file with every data file's row groups, for pyarrow and the like."""
+    metadata = None
+    for path in sorted(root.glob(dataset_files)):
+        file_metadata = pq.read_metadata(path)
+        file_metadata.set_file_path(str(path.relative_to(root)))
+        if metadata is None:
+            metadata = file_metadata
+        else:
+            metadata.append_row_groups(file_metadata)
+    if metadata is not None:
+        write_atomic(root / "_metadata", metadata.write_metadata_file)
+
+
+# The manifest records each partition of the M_IDs, the batches committed
+# from it and the highest M_ID in them, so an interrupted run can pick up
+# after the last committed batch of every partition.
+if args.resume is not None:
+    output = args.resume
+    manifest = json.loads((output / "manifest.json").read_text())
+    for tmp in output.glob("**/*.tmp"):
+        tmp.unlink()
+    # A batch is several files, drop any from a batch that wasn't committed
+    committed = {
+        file
+        for partition in manifest["partitions"]
+        for batch in partition["batches"]
+        for file in batch["files"]
+    }
+    for path in output.glob("**/*.parquet"):
+        if str(path.relative_to(output)) not in committed:
+            path.unlink()
+else:
+    output = Path("output", datetime.now().strftime("%m%d%H%M%S"))
+    output.mkdir(parents=True, exist_ok=False)
+    # The last partition is left open so records added since the
+    # partitions were planned are still exported.
+    highs = [None]
+    if args.partitions > 1:
+        if mimsy is None:
+            ranges = input_partitions(args.partitions)
+        else:
+            with mimsy.cursor() as cursor:
+                cursor.execute(partitions_query.format(args.partitions))
+                ranges = cursor.fetchall()
+        highs = [high for (_, high) in ranges][:-1] + [None]
+    manifest = {
+        "partitions": [
+            {"high": high, "last_m_id": low, "batches": []}
+            for (low, high) in zip([-1, *highs[:-1]], highs)
+        ]
+    }
+    if args.previous is not None:
+        manifest["previous"] = str(args.previous)
+    if inputs is not None:
+        manifest["input"] = inputs
+
+# An incremental export only parses new or changed records. Unchanged
+# records keep their rows from the previous export, so each batch file
+# is still a full snapshot and delta/ holds just the re-parsed rows.
+previous = None
+if "previous" in manifest:
+    previous = scan_dataset(Path(manifest["previous"]))
+    if not {c for (c, _) in schema} <= set(previous.collect_schema().names()):
+        parser.error(f"{manifest["previous"]} was exported with other columns")
+    (output / "delta").mkdir(exist_ok=True)
+
+# The reports are rebuilt from the batches already committed when resuming
+report = Report(output, args.report_format, args.qi_csv)
+for partition in manifest["partitions"]:
+    for batch in partition["batches"]:
+        for file in batch["files"]:
+            if not file.startswith("delta"):
+                report.add(read_dataset_file(output / file))
+
+# Partitions share the cache, the grammar stats and the manifest
+export_lock = threading.Lock()
+
+# The slowest strings parsed as (seconds, M_ID, MEASUREMENTS), and the
+# profiles of the batches sampled with --profile-every
+slowest = []
+profiles = []
+# Only one profiler can be active at a time, a partition that comes to a
+# sampled batch while another is profiling parses it as usual
+profile_lock = threading.Lock()
+
+
+def write_batch(
+    partition: dict,
+    batch_file: str,
+    batch_last: int,
+    parsed_rows: pl.DataFrame,
+    unchanged: pl.DataFrame | None,
+) -> int:
+    """Write a parsed batch and commit it to the manifest, returns the rows written."""
+    checkpoint = {"last_m_id": batch_last}
+    if unchanged is None:
+        checkpoint["files"] = write_dataset(parsed_rows, output, batch_file)
+        checkpoint["rows"] = len(parsed_rows)
+        report.add(parsed_rows)
+    else:
+        snapshot = pl.concat([unchanged, parsed_rows]).sort("M_ID", maintain_order=True)
+        checkpoint["files"] = write_dataset(
+            parsed_rows, output / "delta", batch_file
+        ) + write_dataset(snapshot, output, batch_file)
+        checkpoint["rows"] = len(snapshot)
+        checkpoint["delta_rows"] = len(parsed_rows)
+        report.add(snapshot)
+
+    with export_lock:
+        partition["last_m_id"] = batch_last
+        partition["batches"].append(checkpoint)
+        write_atomic(
+            output / "manifest.json",
+            lambda path: path.write_text(json.dumps(manifest, indent=2)),
+        )
+    return checkpoint["rows"]
+
+
+def export_partition(index: int, connection) -> int | None:
+    """Fetch, parse and write one partition, returns its round trips to Oracle.
+
+    Batches are fetched and written in their own threads while this one
+    parses, so the three overlap.
+    """
+    partition = manifest["partitions"][index]
+    prefix = f"p{index:02d}-" if len(manifest["partitions"]) > 1 else ""
+    trips_before = round_trips(connection)
+    if connection is None:
+        records = input_measurements(partition["last_m_id"], partition["high"])
+    else:
+        records = measurements(partition["last_m_id"], partition["high"], connection)
+    # The previous export's rows for the partition are read once, in M_ID
+    # order, and each batch takes the ones up to its last M_ID
+    previous_rows = None
+    if previous is not None:
+        previous_rows = previous.filter(pl.col("M_ID") > partition["last_m_id"])
+        if partition["high"] is not None:
+            previous_rows = previous_rows.filter(pl.col("M_ID") <= partition["high"])
+        previous_rows = (
+            previous_rows.select(c for (c, _) in schema)
+            # Exports from before the fast path was labelled mimsy
+            .with_columns(pl.col("Grammar").replace("fast", "mimsy"))
+            .pipe(normalize)
+            .sort("M_ID", maintain_order=True)
+            .collect()
+        )
+    fetcher = Fetcher(records, args.queue_depth)
+    writer = Writer(partial(write_batch, partition), args.queue_depth)
+    fetcher.start()
+    writer.start()
+    try:
+        for batch_no, items in enumerate(fetcher, start=len(partition["batches"])):
+            waiting = fetcher.waiting
+            start = perf_counter()
+            batch_file = f"{prefix}{batch_no:03d}.parquet"
+            if is_notebook:
+                print(f"{batch_file}...")
+            fetched = len(items)
+
+            batch_last = items[-1][0]
+            unchanged = None
+            if previous_rows is not None:
+                end = previous_rows.select(
+                    pl.col("M_ID").search_sorted(batch_last, side="right")
+                ).item()
+                batch_previous = previous_rows[:end]
+                previous_rows = previous_rows[end:]
+                # Records that timed out are parsed again, with this run's budget
+                previous_hashes = (
+                    batch_previous.filter(pl.col("Parse Timeout").not_())
+                    .select("M_ID", pl.col("MEASUREMENTS").hash().alias("hash"))
+                    .unique("M_ID")
+                )
+                batch = pl.DataFrame(items, schema=schema[:2], orient="row")
+                batch = batch.with_columns(
+                    pl.col("MEASUREMENTS").hash().alias("hash")
+                ).join(
+                    previous_hashes,
+                    on="M_ID",
+                    how="left",
+                    suffix="_previous",
+                    maintain_order="left",
+                )
+                is_unchanged = pl.col("hash") == pl.col("hash_previous")
+                unchanged = batch_previous.filter(
+                    pl.col("M_ID").is_in(batch.filter(is_unchanged)["M_ID"])
+                )
+                items = (
+                    batch.filter(is_unchanged.not_().fill_null(True))
+                    .select("M_ID", "MEASUREMENTS")
+                    .rows()
+                )
+
+            keys = clean_strings([text for (_, text) in items])
+            entries = {}
+            with export_lock:
+                for key in keys:
+                    if key in entries:
+                        cache.hits += 1
+                    else:
+                        entries[key] = cache.get(key)
+
+            misses = [key for (key, entry) in entries.items() if entry is None]
+            m_ids = {}
+            for (m_id, _), key in zip(items, keys):
+                m_ids.setdefault(key, m_id)
+
+            # Worker processes can't be profiled from here, so sampled
+            # batches are parsed in this thread instead
+            profile = None
+            if (
+                args.profile_every
+                and batch_no % args.profile_every == 0
+                and profile_lock.acquire(blocking=False)
+            ):
+                profile = cProfile.Profile()
+                profile.enable()
+            flatten_seconds = 0.0
+            flattened = 0
+            for parsed_texts, stats, timings in (parse_map if profile is None else map)(
+                partial(
+                    parse_chunk,
+                    fast_path_mode=args.fast_path,
+                    slowest=args.slowest,
+                    budget=args.time_budget,
+                    max_length=args.max_length,
+                    compiled_mode=args.compiled,
+                ),
+                chunked(misses, args.chunk_size),
+            ):
+                flatten_seconds += timings["flatten"]
+                with export_lock:
+                    for key, entry in parsed_texts:
+                        entries[key] = entry
+                        flattened += len(entry[1])
+                        # A timeout says as much about how busy the machine
+                        # was as about the string, the next run tries again
+                        if not any(row[1] for row in entry[1]):
+                            cache.put(key, entry)
+                    merge_stats(grammar_stats, stats)
+                    for seconds, key in timings["slowest"]:
+                        item = (seconds, m_ids[key], key)
+                        if len(slowest) < args.slowest:
+                            heapq.heappush(slowest, item)
+                        elif slowest:
+                            heapq.heappushpop(slowest, item)
+            if profile is not None:
+                profile.disable()
+                profiles.append(profile)
+                profile_lock.release()
+            record_stage("flatten", flattened, flatten_seconds)
+            with export_lock:
+                cache.commit()
+
+            frame_start = perf_counter()
+            parsed_rows = normalize(
+                rows_frame(
+                    [
+                        (m_id, text, key if key != text else None, entries[key][0])
+                        + tuple(row)
+                        for ((m_id, text), key) in zip(items, keys)
+                        for row in entries[key][1]
+                    ]
                 )
             )
-        except pp.ParseException:
-            results.append(base_res)
-            continue
-
-        for f in dimensions["facets"]:
-            f_res = deepcopy(base_res)
-            if "type" in f:
-                types = f["type"]
-                if len(types) > 0:
-                    f_res["Type"] = types[0]
-                if len(types) > 1:
-                    f_res["Type (additional)"] = " ".join(f["type"][1:])
-
-            if not "measurements" in f:
-                print(item["MEASUREMENTS"])
-                print(dimensions.as_dict())
-                if "Type" in f_res:
-                    results.append(f_res)
-                continue
+            record_stage("frame", len(parsed_rows), perf_counter() - frame_start)
+            record_stage("parse", len(parsed_rows), perf_counter() - start, waiting)
+            writer.put(batch_file, batch_last, parsed_rows, unchanged)
+            if progress is not None:
+                progress.add(fetched)
+    finally:
+        fetcher.stop()
+        writer.close()
+
+    trips_after = round_trips(connection)
+    if trips_before is None or trips_after is None:
+        return None
+    return trips_after - trips_before
+
+
+progress = None
+if args.progress is not None:
+    # Counting what's left takes another query, so it's only made for this
+    progress = Progress(
+        sum(
+            (input_count if mimsy is None else record_count)(
+                partition["last_m_id"], partition["high"]
+            )
+            for partition in manifest["partitions"]
+        ),
+        args.progress,
+    )
+
+fetch_stats.update(rows=0, batches=0, seconds=0.0)
+export_start = perf_counter()
+if len(manifest["partitions"]) == 1:
+    trips = [export_partition(0, mimsy)]
+elif mimsy is None:
+    # Reading files needs no connections, just a thread per partition
+    with ThreadPoolExecutor(max_workers=len(manifest["partitions"])) as threads:
+        trips = list(
+            threads.map(
+                partial(export_partition, connection=None),
+                range(len(manifest["partitions"])),
+            )
+        )
+else:
+    # Fetching mostly waits on Oracle, so each partition gets a thread and
+    # a pooled connection, and they all parse through the same parse_map.
+    mimsy_pool = oracledb.create_pool(
+        **mimsy_params,
+        min=len(manifest["partitions"]),
+        max=len(manifest["partitions"]),
+    )
 
-            f_res["Too Many Dimensions"] = len(f["measurements"]) > 5
-            for m in f["measurements"]:
-                m_res = deepcopy(f_res)
-                units = set()
-                for i, d in enumerate(m["dimensions"]):
-                    if "context" in d:
-                        m_res[f"Dimension{i+1} Context"] = " ".join(d["context"])
-                    if "value" in d:
-                        m_res[f"Dimension{i+1} Value"] = d["value"]
-                    if "unit" in d:
-                        units.add(d["unit"])
-
-                m_res["Inconsistent Units"] = len(units) > 1
-
-                m_res[f"Units"] = ", ".join(units)
-                results.append(m_res)
-
-        pl.DataFrame(
-            results,
-            schema=[
-                ("M_ID", pl.Int64),
-                ("MEASUREMENTS", pl.String),
-                ("Parse Error", pl.String),
-                ("Inconsistent Units", pl.Boolean),
-                ("Too Many Dimensions", pl.Boolean),
-                ("Type", pl.String),
-                ("Type (additional)", pl.String),
-                ("Units", pl.String),
-                ("Dimension1 Context", pl.String),
-                ("Dimension1 Value", pl.String),
-                ("Dimension2 Context", pl.String),
-                ("Dimension2 Value", pl.String),
-                ("Dimension3 Context", pl.String),
-                ("Dimension3 Value", pl.String),
-                ("Dimension4 Context", pl.String),
-                ("Dimension4 Value", pl.String),
-                ("Dimension5 Context", pl.String),
-                ("Dimension5 Value", pl.String),
-            ],
-            # ).write_csv(output / f"{batch_no:03d}.csv")
-        ).write_parquet(output / f"{batch_no:03d}.parquet")
+    def export_pooled(index: int) -> int | None:
+        with mimsy_pool.acquire() as connection:
+            return export_partition(index, connection)
+
+    with ThreadPoolExecutor(max_workers=len(manifest["partitions"])) as threads:
+        trips = list(threads.map(export_pooled, range(len(manifest["partitions"]))))
+    mimsy_pool.close()
+
+if previous is not None:
+    # Records that were in the previous export but no longer have
+    # measurements, timed out or not
+    previous.select("M_ID").unique().join(
+        scan_dataset(output).select("M_ID").unique(),
+        on="M_ID",
+        how="anti",
+    ).sort("M_ID").collect().write_csv(output / "removed.csv")
+    write_summary(output / "delta")
+write_summary(output)
+report.close()
+
+if pool is not None:
+    pool.shutdown()
+export_seconds = perf_counter() - export_start
+
+metrics = {
+    "seconds": export_seconds,
+    "fetch": fetch_stats,
+    "round_trips": None if None in trips else sum(trips),
+    "stages": stage_stats,
+    "grammars": {
+        name: {
+            "attempts": attempts,
+            "matches": matches,
+            "seconds": seconds,
+            "failed_seconds": failed,
+            # attempts by the µs they took at least, in powers of two
+            "latency_us": {
+                2**bucket: count for (bucket, count) in enumerate(latencies) if count
+            },
+        }
+        for name, (
+            attempts,
+            matches,
+            seconds,
+            failed,
+            latencies,
+        ) in grammar_stats.items()
+    },
+    "cache": {"hits": cache.hits, "misses": cache.misses, "disk_hits": cache.disk_hits},
+    "slowest": [
+        {"M_ID": m_id, "MEASUREMENTS": text, "seconds": seconds}
+        for (seconds, m_id, text) in sorted(slowest, reverse=True)
+    ],
+}
+write_atomic(
+    output / "metrics.json",
+    lambda path: path.write_text(json.dumps(metrics, indent=2)),
+)
+if profiles:
+    pstats.Stats(*profiles).dump_stats(output / "profile.pstats")
 
 if is_notebook:
-    print(f"{output} done!")
+    print(f"{output} done in {export_seconds:.1f}s")
+    for name, stats in stage_stats.items():
+        print(
+            f"{name}: {stats["rows"]} rows in {stats["seconds"]:.1f}s"
+            + (" across the workers" if name == "flatten" and pool else "")
+            + f" ({stats["rows"] / max(stats['seconds'], 1e-9):.0f} rows/s)"
+            + (
+                f", {stats["waiting"] / max(stats['batches'], 1):.1f} batches queued"
+                f" on average, {stats["most_waiting"]} at most"
+                if name in ["parse", "write"]
+                else ""
+            )
+        )
+    print(
+        f"fetched {fetch_stats["rows"]} rows in {fetch_stats["batches"]} batches,"
+        f" {fetch_stats["seconds"]:.1f}s waiting on"
+        f" {'Oracle' if mimsy is not None else 'the input files'}"
+        f" ({fetch_stats["rows"] / max(fetch_stats['seconds'], 1e-9):.0f} rows/s)"
+    )
+    if None not in trips:
+        print(f"{sum(trips)} round trips to Oracle")
+    for name, (attempts, matches, seconds, failed, _) in grammar_stats.items():
+        print(
+            f"{name}: {matches} of {attempts} matched ({matches / max(attempts, 1):.0%}), {seconds:.2f}s"
+            f" ({failed:.2f}s on failures)"
+        )
+    print(f"cache: {cache.hits} hits, {cache.misses} misses")
+    if args.cache_file is not None:
+        print(f"{args.cache_file}: {cache.disk_hits} hits")
+    for item in metrics["slowest"][:5]:
+        print(
+            f"{item["seconds"] * 1000:.1f}ms M_ID {item["M_ID"]}: {item["MEASUREMENTS"]}"
+        )
+    if profiles:
+        pstats.Stats(*profiles).sort_stats("cumulative").print_stats(20)
+
+# %%
+# Most strings give the same facet in inches and then in cm, or the other
+# way round, and the two should agree once normalized.
+imperial_units = ["in", '"', "inches", "ft", "'"]
+metric_units = ["cm", "m", "mm"]
+
+
+def pair_mismatches(
+    rows: pl.LazyFrame, tolerance: float = 0.02, slack: float = 0.15
+) -> pl.LazyFrame:
+    """Neighbouring imperial and metric measurements of a facet that disagree.
+
+    Dimensions agree within tolerance of the larger of the two, or within
+    slack cm, which covers rounding to the nearest 1/16 in or mm.
+    """
+    measurements = (
+        rows.with_columns(
+            pl.when(pl.col("Units").is_in(imperial_units))
+            .then(pl.lit("imperial"))
+            .when(pl.col("Units").is_in(metric_units))
+            .then(pl.lit("metric"))
+            .alias("System"),
+            pl.sum_horizontal(
+                (pl.col(f"Dimension{n} Value").str.strip_chars() != "").fill_null(False)
+                for n in range(1, 6)
+            ).alias("Dimensions"),
+        )
+        .filter(pl.col("System").is_not_null())
+        .select(
+            "M_ID",
+            "MEASUREMENTS",
+            "Facet",
+            "Measurement",
+            "System",
+            "Units",
+            "Dimensions",
+            "Missing Units",
+            "Normalization Failed",
+            *(f"Dimension{n} Value (normalized)" for n in range(1, 6)),
+        )
+    )
+    pairs = measurements.join(
+        measurements.drop("MEASUREMENTS").with_columns(pl.col("Measurement") - 1),
+        on=["M_ID", "Facet", "Measurement"],
+        suffix=" (next)",
+    ).filter(pl.col("System") != pl.col("System (next)"))
+
+    def disagree(n: int) -> pl.Expr:
+        (a, b) = (
+            pl.col(f"Dimension{n} Value (normalized)"),
+            pl.col(f"Dimension{n} Value (normalized) (next)"),
+        )
+        return ((a - b).abs() > pl.max_horizontal(a.abs(), b.abs()) * tolerance).and_(
+            (a - b).abs() > slack
+        )
+
+    return pairs.with_columns(
+        (pl.col("Dimensions") != pl.col("Dimensions (next)")).alias(
+            "Dimension Count Differs"
+        ),
+        pl.any_horizontal(disagree(n).fill_null(False) for n in range(1, 6)).alias(
+            "Dimensions Disagree"
+        ),
+    ).filter(
+        pl.col("Dimension Count Differs")
+        | pl.col("Dimensions Disagree")
+        | pl.col("Missing Units")
+        | pl.col("Missing Units (next)")
+        | pl.col("Normalization Failed")
+        | pl.col("Normalization Failed (next)")
+    )
+
+
+if any(output.glob(dataset_files)):
+    pair_mismatches(scan_dataset(output)).collect().write_csv(
+        output / "pair_mismatches.csv"
+    )
+    if is_notebook:
+        print(pl.read_csv(output / "pair_mismatches.csv"))
+
 
 # %%
 if is_notebook:
-    all_rows = pl.scan_parquet(output / "*.parquet")
-    all_rows.filter(pl.col("Parse Error").is_not_null()).sink_csv(
-        output / "parse_errors.csv"
-    )
-    all_rows.filter(
-        pl.col("Inconsistent Units") | pl.col("Too Many Dimensions")
-    ).sink_csv(output / "parse_anomalies.csv")
-    all_rows.filter(
-        pl.col("Parse Error").is_null()
-        & pl.col("Inconsistent Units").not_()
-        & pl.col("Too Many Dimensions").not_()
-    ).drop("Parse Error", "Inconsistent Units", "Too Many Dimensions").sink_csv(
-        output / "parse_results.csv"
+    print(
+        pl.read_csv(output / "summary.csv")
+        if args.report_format == "csv"
+        else pl.read_parquet(output / "summary.parquet")
     )
 
 
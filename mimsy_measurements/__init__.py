@@ -0,0 +1,45 @@
+"""Parse Mimsy MEASUREMENTS strings into facets, volumes and dimensions.
+
+    >>> from mimsy_measurements import parse
+    >>> [(f.types, len(f.volumes)) for f in parse("Overall: 9 in; 22.9 cm")]
+    [(['Overall'], 2)]
+
+Importing the package builds none of the grammars and connects to nothing.
+They are put together the first time one is used, and reading from Mimsy
+is left to MeasurementsParsing.py.
+"""
+
+from . import grammar
+from .clean import clean, clean_strings
+from .compiled import compare_compiled, compiled_mimsy
+from .dispatch import (
+    Dispatch,
+    dispatch,
+    grammar_hits,
+    grammar_stats,
+    merge_stats,
+    new_stats,
+    parse,
+    route,
+    tally,
+)
+from .fast import fast_path
+from .grammar import configure_packrat, grammar_names
+from .model import Dimension, Facet, Model, Volume, facets_from, facets_to_arrow
+from .rows import (
+    chunked,
+    compare_fast_path,
+    flatten,
+    parse_chunk,
+    parse_record,
+    rows_frame,
+    schema,
+)
+from .units import normalize, number, unit_conversions, vulgar_fractions
+
+
+def __getattr__(name: str):
+    # dim, mimsy_string, grammars and the rest are only built when asked for
+    if name in grammar.grammar_elements or name == "grammars":
+        return getattr(grammar, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
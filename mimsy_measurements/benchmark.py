@@ -0,0 +1,298 @@
+"""Throughput, latency and memory of cleaning, the fast path, each grammar and the cascade.
+
+Every run parses the same seeded synthetic corpus, so a saved run can be
+compared with one after a grammar change:
+
+    python -m mimsy_measurements.benchmark --rows 100000 --save before.json
+    python -m mimsy_measurements.benchmark --rows 100000 --baseline before.json
+
+Each phase is warmed up and then timed --repeat times, keeping the
+fastest pass, and one that is still slower than its baseline by more
+than --tolerance is a regression and fails the run. With --check every
+string is first parsed by both the compiled parser and mimsy_string, and
+any difference between them fails the run too.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import tracemalloc
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+from time import perf_counter, perf_counter_ns
+
+import pyparsing as pp
+
+from . import corpus
+from .clean import clean_strings
+from .compiled import compare_compiled, compiled_mimsy
+from .dispatch import dispatch, grammar_hits
+from .fast import fast_path
+from .grammar import build, configure_packrat, grammar_names, string_grammars
+from .rows import parse_record
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss() -> int | None:
+    """The process's resident memory high-water mark so far, in bytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(texts: list[str], parse: Callable[[str], object]) -> dict:
+    """strings/s, latency percentiles in µs and memory high-water marks."""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    latencies = []
+    start = perf_counter()
+    for text in texts:
+        text_start = perf_counter_ns()
+        parse(text)
+        latencies.append(perf_counter_ns() - text_start)
+    seconds = perf_counter() - start
+
+    result = {
+        "strings": len(texts),
+        "seconds": seconds,
+        "strings_per_second": len(texts) / seconds if seconds else None,
+    }
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        result.update(
+            p50_us=cuts[49] / 1000,
+            p90_us=cuts[89] / 1000,
+            p99_us=cuts[98] / 1000,
+            max_us=max(latencies) / 1000,
+        )
+    result["peak_rss"] = peak_rss()
+    if tracemalloc.is_tracing():
+        result["peak_traced"] = tracemalloc.get_traced_memory()[1]
+    return result
+
+
+def grammar_parser(name: str) -> Callable[[str], object]:
+    grammar = string_grammars()[name]
+
+    def parse(text: str):
+        try:
+            return grammar.parse_string(text, parse_all=True)
+        except pp.ParseBaseException:
+            return None
+
+    return parse
+
+
+def cascade(fast_path_mode: str, compiled_mode: str = "on") -> Callable[[str], object]:
+    def parse(text: str):
+        return parse_record(text, fast_path_mode, compiled_mode=compiled_mode)
+
+    # The cascade learns its order as it goes, each pass starts from scratch
+    for name in grammar_hits:
+        grammar_hits[name] = 0
+    return parse
+
+
+# Each phase first parses this many of its strings untimed, so nothing
+# built or cached on first use is put down to it
+warmup_strings = 1000
+
+
+def run(texts: list[str], repeat: int = 1) -> dict[str, dict]:
+    """Each phase's measurements, by phase name, the fastest of repeat passes.
+
+    The machine speeds up and slows down over seconds at a time, so the
+    passes go round every phase in turn rather than repeating one phase
+    back to back, and each phase gets passes at different times.
+    """
+    phases = {}
+
+    start = perf_counter()
+    build()
+    phases["build"] = {"seconds": perf_counter() - start, "peak_rss": peak_rss()}
+
+    # The export cleans a batch at a time and parses the cleaned strings
+    raw = texts
+    texts = clean_strings(raw)
+
+    # Each grammar on the strings the cascade gives it, and the fast path on
+    # every string, since most of its time goes on the ones it turns down
+    matched = {name: [] for name in ["fast", *grammar_names]}
+    for text in dict.fromkeys(texts):
+        grammar = dispatch(text).grammar
+        if grammar is not None:
+            matched[grammar].append(text)
+    # mimsy_string parses everything the fast path does
+    matched["mimsy"] += matched.pop("fast")
+
+    # The strings each phase parses, and a function giving it a parser
+    timed = {
+        "fast": (texts, lambda: fast_path),
+        **{
+            name: (matched[name], partial(grammar_parser, name))
+            for name in grammar_names
+        },
+        "mimsy (compiled)": (matched["mimsy"], lambda: compiled_mimsy),
+        "cascade": (texts, partial(cascade, "on")),
+        "cascade (no fast path)": (texts, partial(cascade, "off")),
+        "cascade (pyparsing only)": (texts, partial(cascade, "off", "off")),
+    }
+    clean_strings(raw[:warmup_strings])
+    for strings, parser in timed.values():
+        parse = parser()
+        for text in strings[:warmup_strings]:
+            parse(text)
+
+    for _ in range(repeat):
+        start = perf_counter()
+        clean_strings(raw)
+        seconds = perf_counter() - start
+        if "clean" not in phases or seconds < phases["clean"]["seconds"]:
+            phases["clean"] = {
+                "strings": len(raw),
+                "seconds": seconds,
+                "strings_per_second": len(raw) / seconds if seconds else None,
+                "peak_rss": peak_rss(),
+            }
+        for name, (strings, parser) in timed.items():
+            result = measure(strings, parser())
+            if name not in phases or result["seconds"] < phases[name]["seconds"]:
+                phases[name] = result
+    return phases
+
+
+def report(phases: dict[str, dict], baseline: dict[str, dict] | None = None):
+    print(
+        f"{'phase':<24}{'strings':>9}{'strings/s':>11}{'p50 µs':>9}{'p90 µs':>9}"
+        f"{'p99 µs':>9}{'max µs':>10}{'RSS MB':>8}{'traced MB':>11}"
+        + (f"{'vs baseline':>13}" if baseline is not None else "")
+    )
+    for name, phase in phases.items():
+        row = f"{name:<24}{phase.get('strings', ''):>9}"
+        rate = phase.get("strings_per_second")
+        row += f"{rate:>11.0f}" if rate is not None else f"{phase["seconds"]:>10.2f}s"
+        for key in ["p50_us", "p90_us", "p99_us"]:
+            row += f"{phase[key]:>9.1f}" if key in phase else " " * 9
+        row += f"{phase["max_us"]:>10.0f}" if "max_us" in phase else " " * 10
+        for key, width in [("peak_rss", 8), ("peak_traced", 11)]:
+            value = phase.get(key)
+            row += f"{value / 2**20:>{width}.1f}" if value is not None else " " * width
+        if baseline is not None and change(phase, baseline.get(name)) is not None:
+            row += f"{change(phase, baseline[name]):>+13.1%}"
+        print(row)
+
+
+def change(phase: dict, base: dict | None) -> float | None:
+    """How much more (positive) or fewer strings/s a phase parsed than its baseline."""
+    if base is None or not phase.get("strings_per_second"):
+        return None
+    if not base.get("strings_per_second"):
+        return None
+    return phase["strings_per_second"] / base["strings_per_second"] - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="time each phase this many times and keep the fastest",
+    )
+    parser.add_argument(
+        "--duplicates",
+        type=float,
+        default=0.0,
+        help="share of strings repeating an earlier one, the export caches those",
+    )
+    parser.add_argument(
+        "--packrat",
+        type=int,
+        nargs="?",
+        const=128,
+        default=None,
+        metavar="CACHE_SIZE",
+        help="memoize the grammars with pyparsing's packrat cache, 0 is unbounded",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="also record the Python heap's high-water mark, slows every phase down",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="fail on any string the compiled parser and mimsy_string disagree on",
+    )
+    parser.add_argument("--save", type=Path, default=None, metavar="FILE")
+    parser.add_argument("--baseline", type=Path, default=None, metavar="FILE")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="how much slower than the baseline a phase may get",
+    )
+    args = parser.parse_args()
+
+    corpus_args = {"rows": args.rows, "seed": args.seed, "duplicates": args.duplicates}
+    baseline = None
+    if args.baseline is not None:
+        saved = json.loads(args.baseline.read_text())
+        if saved["corpus"] != corpus_args:
+            parser.error(
+                f"{args.baseline} was run on another corpus: {saved["corpus"]}"
+            )
+        baseline = saved["phases"]
+
+    configure_packrat(args.packrat)
+    texts = [
+        text for (_, text) in corpus.generate(args.rows, args.seed, args.duplicates)
+    ]
+    if args.check:
+        mismatches = compare_compiled(list(dict.fromkeys(texts)))
+        for mismatch in mismatches[:10]:
+            print("Compiled parser mismatch:", mismatch)
+        if mismatches:
+            print(
+                f"{len(mismatches)} differences between the compiled parser and mimsy_string"
+            )
+            sys.exit(1)
+    if args.tracemalloc:
+        tracemalloc.start()
+    phases = run(texts, args.repeat)
+    report(phases, baseline)
+
+    if args.save is not None:
+        args.save.write_text(
+            json.dumps(
+                {
+                    "corpus": corpus_args,
+                    "packrat": args.packrat,
+                    "repeat": args.repeat,
+                    "phases": phases,
+                },
+                indent=2,
+            )
+        )
+    if baseline is not None:
+        regressions = [
+            name
+            for (name, phase) in phases.items()
+            if (change(phase, baseline.get(name)) or 0) < -args.tolerance
+        ]
+        if regressions:
+            print(f"slower than {args.baseline}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""MEASUREMENTS strings tidied up a batch at a time, before any is parsed.
+
+The export parses the cleaned strings and caches what they parse to by
+them, so strings that differ only in spacing, "×" for "x" or how a
+fraction is written are parsed once. The MEASUREMENTS column keeps the
+string as it was in Mimsy.
+"""
+
+import polars as pl
+
+from .units import vulgar_fractions
+
+
+def clean(measurements: pl.Expr) -> pl.Expr:
+    """measurements with each "×" as " x " and fractions like "½" as " 1/2".
+
+    Runs of whitespace become one space, and the whitespace at either end
+    goes with any ";", ",", "/" or " x" the string ends in. A "×" runs on
+    into the value before it where an "x" separates two dimensions, and
+    every grammar reads "x" and " 1/2".
+    """
+    return (
+        measurements.str.replace_all("×", " x ", literal=True)
+        .str.replace_many(list(vulgar_fractions), list(vulgar_fractions.values()))
+        .str.replace_all(r"\s+", " ")
+        .str.strip_chars(" ")
+        .str.replace(r"(?: x|[ ;,/])+$", "")
+    )
+
+
+def clean_strings(texts: list[str]) -> list[str]:
+    """Each of texts cleaned, in one pass over all of them."""
+    return (
+        pl.DataFrame({"MEASUREMENTS": texts}, schema={"MEASUREMENTS": pl.String})
+        .select(clean(pl.col("MEASUREMENTS")))
+        .to_series()
+        .to_list()
+    )
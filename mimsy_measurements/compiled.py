@@ -0,0 +1,111 @@
+"""mimsy_string written out by hand as a recursive descent parser.
+
+pyparsing spends most of its time going from element to element rather
+than matching anything, so the grammar that parses most of CATALOGUE is
+also written out here: a string is facets, a facet an optional type,
+colons and volumes, a volume dimensions. Each piece is a regex matched
+where the last one ended and, like the pyparsing elements, none of them
+gives back what it has matched, so the two accept the same strings and
+give the same facets. mimsy_string stays the definition of the grammar,
+compare_compiled() checks this parser against it.
+"""
+
+import re
+
+import pyparsing as pp
+
+from .grammar import build, extra_x_strip, space, vol_dim_pattern
+from .model import Dimension, Facet, Volume
+
+
+def chars(*sets: str) -> str:
+    """The characters of pyparsing's sets, escaped for a character class."""
+    return re.escape("".join(sets))
+
+
+# The characters of each word of a facet's type, as dimensions has them
+bracketed_chars = chars(pp.alphanums, pp.alphas8bit, "/-.;& ")
+type_chars = chars(pp.alphas, pp.alphas8bit, "/-&?'# ")
+semicolon_chars = chars(pp.alphas, pp.alphas8bit, "-")
+comma_chars = chars(pp.alphas, pp.alphas8bit, "/, ")
+
+bracketed = rf"\(([{bracketed_chars}]++)\)"
+facet_type = re.compile(
+    rf"{space}(?:{bracketed})?+{space}([{type_chars}]++)"
+    rf"(?:{space};{space}([{semicolon_chars}]++))?+"
+    rf"(?:{space},{space}([{comma_chars}]++))?+"
+    rf"(?:{space}{bracketed})?+"
+)
+colons = re.compile(rf"(?:{space}:)*+")
+semicolons = re.compile(rf"(?:{space};)*+")
+dimension = re.compile(vol_dim_pattern)
+string_end = re.compile(rf"(?:{space}cm)?+(?:{space}Image:)?+{space}\Z")
+
+
+def read_volume(text: str, loc: int) -> tuple[Volume | None, int]:
+    dimensions = []
+    while match := dimension.match(text, loc):
+        (value, unit, dot, context_bracketed, context) = match.groups()
+        if unit is None:
+            dimensions.append(Dimension(extra_x_strip(value)))
+        else:
+            contexts = []
+            if context_bracketed is not None:
+                contexts.append(context_bracketed.strip())
+            if context is not None:
+                contexts.append(extra_x_strip(context))
+            dimensions.append(Dimension(extra_x_strip(value), unit, " ".join(contexts)))
+        loc = match.end()
+    return (Volume(dimensions) if dimensions else None, loc)
+
+
+def read_facet(text: str, loc: int) -> tuple[Facet | None, int]:
+    types = []
+    match = facet_type.match(text, loc)
+    if match is not None:
+        types = [t.strip() for t in match.groups() if t is not None]
+        loc = match.end()
+    loc = colons.match(text, loc).end()
+
+    volumes = []
+    while True:
+        (volume, end) = read_volume(text, loc)
+        if volume is None:
+            break
+        volumes.append(volume)
+        loc = semicolons.match(text, end).end()
+    return (Facet(types, volumes) if volumes else None, loc)
+
+
+def compiled_mimsy(text: str, parse_all: bool = True) -> list[Facet] | None:
+    """The facets mimsy_string.parse_string() gives, or None where it would raise."""
+    # As parse_string() does
+    text = text.expandtabs()
+    facets = []
+    loc = 0
+    while True:
+        (facet, end) = read_facet(text, loc)
+        if facet is None:
+            break
+        facets.append(facet)
+        loc = end
+    if not facets or (parse_all and string_end.match(text, loc) is None):
+        return None
+    return facets
+
+
+def compare_compiled(texts: list[str]) -> list[tuple]:
+    """(text, parse_all, compiled facets, grammar facets) wherever the two disagree."""
+    mismatches = []
+    for text in texts:
+        for parse_all in [True, False]:
+            try:
+                facets = list(
+                    build()["mimsy_string"].parse_string(text, parse_all=parse_all)
+                )
+            except pp.ParseBaseException:
+                facets = None
+            compiled = compiled_mimsy(text, parse_all)
+            if compiled != facets:
+                mismatches.append((text, parse_all, compiled, facets))
+    return mismatches
@@ -0,0 +1,241 @@
+"""A seeded generator of synthetic MEASUREMENTS strings.
+
+The strings take every shape the grammars know, in roughly the mix found in
+CATALOGUE: mostly "<Type>: <dims> in; <dims> cm" facets, some die-axis, HDF,
+parenthetical and straight strings, and a few nothing parses. A share of them
+repeat earlier ones, as catalogued series of objects do. The same seed always
+gives the same strings, so benchmarks of different grammars are comparable.
+
+    python -m mimsy_measurements.corpus --rows 1000000 catalogue.parquet
+
+writes a file the export can read with --input.
+"""
+
+import argparse
+import random
+from collections.abc import Iterator
+from fractions import Fraction
+from pathlib import Path
+
+# How often each kind of string comes up
+kinds = {
+    "mimsy": 0.80,
+    "dieaxis": 0.03,
+    "hdf": 0.04,
+    "parenthetical": 0.06,
+    "straight": 0.03,
+    "unparsed": 0.04,
+}
+
+sixteenths_text = {n: str(Fraction(n, 16)) for n in range(1, 16)}
+unicode_fractions = {"1/2": "½", "1/4": "¼", "3/4": "¾", "1/8": "⅛", "3/8": "⅜"}
+facet_types = [
+    "Overall",
+    "overall",
+    "Sheet",
+    "sheet",
+    "Image",
+    "image",
+    "Frame",
+    "Mat",
+    "Sight",
+    "mount",
+    "sheet/image",
+    "Overall (a)",
+    "overall, w/handle",
+    "image (height & width of fan)",
+]
+contexts = ["height", "diameter", "bowl diameter", "foot diameter", "at highest point"]
+hdf_items = ["cup", "teacup", "saucer", "lid", "bowl", "plate", "stand"]
+unparsed = [
+    "see file",
+    "unknown",
+    "not measured",
+    "n/a",
+    "12 x ? in",
+    "height: unknown",
+    "see parts a-c",
+    "varies; see component records",
+    "Overall: 24 in x 36 in; 61 cm x 91.4 cm ; (sight)",
+]
+
+
+def inches(rng: random.Random) -> float:
+    # Most objects are a few inches to a few feet, in 16ths of an inch
+    return round(rng.lognormvariate(2.2, 0.9) * 16) / 16 or 1 / 16
+
+
+def imperial(value: float, rng: random.Random, unicode: bool = False) -> str:
+    whole = int(value)
+    sixteenths = round((value - whole) * 16)
+    if sixteenths == 0:
+        return str(whole)
+    fraction = sixteenths_text[sixteenths]
+    if unicode and fraction in unicode_fractions and rng.random() < 0.5:
+        return (
+            f"{whole} {unicode_fractions[fraction]}"
+            if whole
+            else unicode_fractions[fraction]
+        )
+    return f"{whole} {fraction}" if whole else fraction
+
+
+def metric(value: float, rng: random.Random) -> str:
+    cm = value * 2.54
+    text = f"{cm:.1f}" if rng.random() < 0.6 else f"{cm:.4f}".rstrip("0").rstrip(".")
+    return text[1:] if text.startswith("0.") else text
+
+
+def volume_pair(rng: random.Random) -> str:
+    """The same dimensions in inches and then, usually, in cm."""
+    values = [inches(rng) for _ in range(rng.choice([1, 2, 2, 3, 3, 3, 4]))]
+    if rng.random() < 0.5:
+        text = " x ".join(f"{imperial(v, rng)} in" for v in values)
+        text += "; " + " x ".join(f"{metric(v, rng)} cm" for v in values)
+    elif rng.random() < 0.15:
+        context = rng.choice(contexts)
+        text = ", ".join(f"{imperial(v, rng)} in ({context})" for v in values)
+        text += "; " + ", ".join(f"{metric(v, rng)} cm ({context})" for v in values)
+        return text
+    else:
+        text = " x ".join(imperial(v, rng) for v in values) + " in."
+        if rng.random() < 0.1:
+            text = text[:-1] + " irregular diameter"
+        text += "; " + " x ".join(metric(v, rng) for v in values) + " cm"
+    if rng.random() < 0.08:
+        # imperial only
+        text = text.split(";")[0]
+    return text
+
+
+def mimsy(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.03:
+        return f"{rng.randint(5, 60)}mm; {rng.uniform(1, 40):.3f}g"
+    if roll < 0.04:
+        return f"{rng.randint(1, 59)} minutes; {rng.randint(0, 59):02d} seconds"
+    if roll < 0.12:
+        return volume_pair(rng)
+    return "; ".join(
+        f"{rng.choice(facet_types)}: {volume_pair(rng)}"
+        for _ in range(rng.choice([1, 1, 1, 1, 2, 2, 3]))
+    )
+
+
+def dieaxis(rng: random.Random) -> str:
+    value = rng.choice([1, 2, 3, 5, 7, 9, 11, 13, 15, 17, 19]) / 16 + rng.randint(0, 2)
+    axis = rng.choice(
+        [f"die axis; {rng.choice([0, 6, 12])} deg.", f"diexis {rng.choice([0, 6, 12])}"]
+    )
+    return (
+        f"{imperial(value, rng)} in. diameter; {metric(value, rng)} cm,"
+        f" weight {rng.uniform(1, 150):.1f} gm., {axis}"
+    )
+
+
+def hdf(rng: random.Random) -> str:
+    items = rng.sample(hdf_items, rng.choice([1, 2, 2, 3]))
+    parts = []
+    for item in items:
+        values = [inches(rng) for _ in range(rng.choice([1, 2, 2, 3]))]
+        separator = rng.choice([" - ", ": ", " "])
+        part = f"{item}{separator}" + " x ".join(imperial(v, rng) for v in values)
+        part += " in."
+        if rng.random() < 0.5:
+            part += "; " + " x ".join(metric(v, rng) for v in values) + " cm"
+        parts.append(part)
+    return "overall: " + "; ".join(parts)
+
+
+def parenthetical(rng: random.Random) -> str:
+    values = [inches(rng) for _ in range(rng.choice([2, 2, 3]))]
+    if rng.random() < 0.2:
+        framed = [v + rng.randint(3, 8) for v in values]
+        return (
+            " x ".join(f'{imperial(v, rng).replace(" ", "-")}"' for v in values)
+            + " / (frame "
+            + " x ".join(f'{imperial(v, rng).replace(" ", "-")}"' for v in framed)
+            + ")"
+        )
+    cross = rng.choice([" x ", " × "])
+    prefix = (
+        f"{rng.choice(['Sheet', 'Image', 'Overall'])}: " if rng.random() < 0.2 else ""
+    )
+    unit = rng.choice(["in.", "in", "inches"])
+    return (
+        prefix
+        + cross.join(imperial(v, rng, unicode=True) for v in values)
+        + f" {unit} ("
+        + cross.join(metric(v, rng) for v in values)
+        + " cm)"
+    )
+
+
+def straight(rng: random.Random) -> str:
+    return " x ".join(
+        f'{imperial(inches(rng), rng)}" {rng.choice([c, c.lower()])}' for c in "HWD"
+    )
+
+
+def measurement(rng: random.Random, kind: str) -> str:
+    """One synthetic string of a kind in kinds."""
+    if kind == "unparsed":
+        return rng.choice(unparsed)
+    return globals()[kind](rng)
+
+
+def generate(
+    count: int, seed: int = 0, duplicates: float = 0.3
+) -> Iterator[tuple[int, str]]:
+    """count (M_ID, MEASUREMENTS) records, duplicates of them repeating an earlier string."""
+    rng = random.Random(seed)
+    names = list(kinds)
+    weights = list(kinds.values())
+    seen = []
+    m_id = 0
+    for _ in range(count):
+        m_id += rng.randint(1, 20)
+        if seen and rng.random() < duplicates:
+            text = rng.choice(seen)
+        else:
+            text = measurement(rng, rng.choices(names, weights)[0])
+            seen.append(text)
+        yield (m_id, text)
+
+
+def main():
+    import polars as pl
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "output", type=Path, help=".parquet, .csv or .jsonl file to write"
+    )
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--duplicates",
+        type=float,
+        default=0.3,
+        help="share of records repeating an earlier string",
+    )
+    args = parser.parse_args()
+
+    writers = {
+        ".parquet": pl.DataFrame.write_parquet,
+        ".csv": pl.DataFrame.write_csv,
+        ".jsonl": pl.DataFrame.write_ndjson,
+        ".ndjson": pl.DataFrame.write_ndjson,
+    }
+    if args.output.suffix.lower() not in writers:
+        parser.error(f"{args.output} is not a .parquet, .csv or .jsonl file")
+    records = pl.DataFrame(
+        generate(args.rows, args.seed, args.duplicates),
+        schema=[("M_ID", pl.Int64), ("MEASUREMENTS", pl.String)],
+        orient="row",
+    )
+    writers[args.output.suffix.lower()](records, args.output)
+    print(f"{len(records)} records written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Try the fast path and then each grammar in turn until one matches."""
+
+import re
+from time import perf_counter
+from typing import NamedTuple
+
+import pyparsing as pp
+
+from .clean import clean_strings
+from .compiled import compiled_mimsy
+from .fast import fast_path
+from .grammar import ParseTimeout, grammar_names, string_grammars
+from .model import Facet
+
+# Strings that look like one of the other grammars try it first, and
+# the rest are tried by how often each grammar has matched so far. Some
+# strings are accepted by more than one grammar, so the order can change
+# their rows: "overall: x 8 in; 22 cm" is a mimsy_string facet typed
+# overall and an hdf_string one typed x. The hints don't match those
+# strings, and grammars that share strings keep the order grammar_names
+# gives them, whatever their hits, so every process routes them alike.
+route_hints = {
+    "dieaxis": re.compile(r"weight.*\bdie ?a?xis", re.IGNORECASE),
+    "hdf": re.compile(r"\s*overall:\s*(?!x(?![a-z]))[a-z]", re.IGNORECASE),
+    "parenthetical": re.compile(r"\(\s*[a-z]*\s*[\d.][^()]*\)\s*$", re.IGNORECASE),
+    "straight": re.compile(r'"\s*H\s*x', re.IGNORECASE),
+}
+grammar_hits = {name: 0 for name in grammar_names}
+# The grammars each one shares strings with and has to be tried after
+tried_after = {"hdf": ["mimsy"]}
+
+
+def route(text: str) -> list[str]:
+    order = []
+    for name in sorted(grammar_names, key=lambda name: -grammar_hits[name]):
+        order += [before for before in tried_after.get(name, []) if before not in order]
+        if name not in order:
+            order.append(name)
+    for name, hint in route_hints.items():
+        if hint.match(text) if name == "hdf" else hint.search(text):
+            order.remove(name)
+            order.insert(0, name)
+            break
+    return order
+
+
+# Attempts are counted by how long they took, in buckets doubling from 1µs,
+# the last one taking everything from about 4s up
+latency_buckets = 23
+
+
+def latency_bucket(seconds: float) -> int:
+    return min(max(int(seconds * 1e6), 1).bit_length(), latency_buckets) - 1
+
+
+def new_stats() -> dict[str, list]:
+    # attempts, matches, seconds, seconds spent on failed attempts, latencies
+    return {
+        name: [0, 0, 0.0, 0.0, [0] * latency_buckets]
+        for name in ["fast", *grammar_names]
+    }
+
+
+grammar_stats = new_stats()
+
+
+def merge_stats(into: dict[str, list], stats: dict[str, list]):
+    for name, (attempts, matches, seconds, failed, latencies) in stats.items():
+        into[name][0] += attempts
+        into[name][1] += matches
+        into[name][2] += seconds
+        into[name][3] += failed
+        for bucket, count in enumerate(latencies):
+            into[name][4][bucket] += count
+
+
+class Dispatch(NamedTuple):
+    grammar: str | None
+    result: list[Facet] | None
+    error: str | None
+    seconds: dict[str, float]
+    timed_out: bool = False
+
+
+def dispatch(
+    text: str, use_fast_path: bool = True, use_compiled: bool = True
+) -> Dispatch:
+    errors = {}
+    seconds = {}
+    if use_fast_path:
+        start = perf_counter()
+        result = fast_path(text)
+        seconds["fast"] = perf_counter() - start
+        if result is not None:
+            return Dispatch("fast", result, None, seconds)
+
+    grammars = string_grammars()
+    for name in route(text):
+        start = perf_counter()
+        try:
+            if name == "mimsy" and use_compiled:
+                result = compiled_mimsy(text)
+                if result is None:
+                    continue
+            else:
+                result = list(grammars[name].parse_string(text, parse_all=True))
+        except ParseTimeout as e:
+            # The rest would most likely take as long
+            error = f"Parse Timeout: {name}_string over the time budget at char {e.loc}"
+            return Dispatch(None, None, error, seconds, True)
+        except pp.ParseBaseException as e:
+            errors[name] = str(e)
+            continue
+        finally:
+            seconds[name] = perf_counter() - start
+
+        grammar_hits[name] += 1
+        return Dispatch(name, result, None, seconds)
+
+    # mimsy_string's error is the most useful when nothing matched, the
+    # compiled parser can't say why it didn't match so it's asked for that
+    if "mimsy" not in errors:
+        start = perf_counter()
+        try:
+            result = list(grammars["mimsy"].parse_string(text, parse_all=True))
+        except ParseTimeout as e:
+            error = f"Parse Timeout: mimsy_string over the time budget at char {e.loc}"
+            return Dispatch(None, None, error, seconds, True)
+        except pp.ParseBaseException as e:
+            errors["mimsy"] = str(e)
+        else:
+            # Only if the two disagree, mimsy_string is the definition
+            grammar_hits["mimsy"] += 1
+            return Dispatch("mimsy", result, None, seconds)
+        finally:
+            seconds["mimsy"] += perf_counter() - start
+    return Dispatch(None, None, errors["mimsy"], seconds)
+
+
+def tally(stats, parsed: Dispatch):
+    for name, seconds in parsed.seconds.items():
+        stats[name][0] += 1
+        stats[name][2] += seconds
+        if name != parsed.grammar:
+            stats[name][3] += seconds
+        stats[name][4][latency_bucket(seconds)] += 1
+    if parsed.grammar is not None:
+        stats[parsed.grammar][1] += 1
+
+
+def parse(text: str) -> list[Facet]:
+    """The facets of a MEASUREMENTS string, from whichever grammar matches it.
+
+    The string is cleaned first, as the export cleans it. Raises ValueError
+    with mimsy_string's error when none of the grammars match.
+    """
+    parsed = dispatch(clean_strings([text])[0])
+    if parsed.grammar is None:
+        raise ValueError(parsed.error)
+    return parsed.result
@@ -0,0 +1,40 @@
+"""A regex fast path for the strings that need none of the grammars."""
+
+import re
+
+from .model import Dimension, Facet, Volume
+
+# Most strings are "<Type>: <dims> in; <dims> cm" with nothing else in them.
+# Those are read with regexes into the same facets/measurements/dimensions
+# structure mimsy_string gives, anything the patterns don't fully cover
+# goes through the grammars.
+fast_segment = re.compile(r"(?:([A-Za-z]+(?: +[A-Za-z]+)*) *: *)?(.+)")
+fast_dim = re.compile(r"(\d+(?:\.\d+)?(?: \d+/\d+)?|\d+/\d+|\.\d+)(?: ?(in|cm|mm)\.?)?")
+
+
+def fast_path(text: str) -> list[Facet] | None:
+    facets = []
+    for segment in text.split(";"):
+        match = fast_segment.fullmatch(segment.strip())
+        if match is None:
+            return None
+
+        (type_, volume) = match.groups()
+        if type_ is not None:
+            facets.append(Facet([type_], []))
+        elif not facets:
+            facets.append(Facet([], []))
+
+        dims = []
+        for dim_text in volume.split(" x "):
+            dim_match = fast_dim.fullmatch(dim_text)
+            if dim_match is None:
+                return None
+            (value, unit) = dim_match.groups()
+            if unit is None:
+                dims.append(Dimension(value))
+            else:
+                dims.append(Dimension(value, unit, ""))
+        facets[-1].volumes.append(Volume(dims))
+
+    return facets
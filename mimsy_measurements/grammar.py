@@ -0,0 +1,349 @@
+"""The pyparsing grammars for MEASUREMENTS strings.
+
+Building them takes longer than most scripts spend parsing, so nothing is
+put together until a grammar is first asked for, either from build() or as
+an attribute of this module or the package (``mimsy_measurements.dim``).
+"""
+
+import contextlib
+import functools
+import re
+import threading
+from time import perf_counter
+
+import pyparsing as pp
+
+from .model import facets_from
+
+# The whole-string grammars, by the name dispatch and the export use for them
+grammar_names = ["mimsy", "dieaxis", "hdf", "parenthetical", "straight"]
+
+# Every grammar build() makes, the pieces as well as the whole strings
+grammar_elements = [
+    "dim",
+    "vol",
+    "dimensions",
+    "mimsy_string",
+    "dieaxis_string",
+    "hdf_dimensions",
+    "hdf_string",
+    "parenthetical_string",
+    "straight_string",
+]
+
+
+# Packrat is off by default, the grammars rarely revisit a position so
+# keeping the cache costs more than it saves (see the benchmark in
+# MeasurementsParsing.py).
+def configure_packrat(cache_size: int | None):
+    pp.ParserElement.disable_memoization()
+    if cache_size is not None:
+        pp.ParserElement.enable_packrat(cache_size or None, force=True)
+
+
+class ParseTimeout(pp.ParseFatalException):
+    """A string took longer than its time_budget, alternatives don't catch it."""
+
+
+# When the string being parsed in this thread runs out of time, if it can
+deadline = threading.local()
+
+
+@contextlib.contextmanager
+def time_budget(seconds: float | None):
+    """Give up on any string parsed inside the block after seconds.
+
+    pyparsing can't be interrupted, so the grammars check the clock each time
+    they try a dimension, a volume or a facet, and a string can't go far
+    without one.
+    """
+    previous = getattr(deadline, "at", None)
+    deadline.at = perf_counter() + seconds if seconds else None
+    try:
+        yield
+    finally:
+        deadline.at = previous
+
+
+def check_deadline(string, location, expr, cache_hit):
+    at = getattr(deadline, "at", None)
+    if at is not None and perf_counter() > at:
+        raise ParseTimeout(string, location, "over the time budget", expr)
+
+
+def budgeted(element: pp.ParserElement) -> pp.ParserElement:
+    """element, checking the time budget whenever it's tried.
+
+    Naming an element copies it, so this has to come before any name is given.
+    """
+    # set_debug_actions() fills in the actions left out with ones that print
+    element.debugActions = pp.ParserElement.DebugActions(check_deadline, None, None)
+    element.debug = True
+    return element
+
+
+# A value runs on over spaces and "×" and ends at the first letter, so it
+# can end in a "×" or "/" that belonged between it and the next one. A
+# context can likewise end in the " x" before the next dimension.
+def extra_x_strip(t):
+    t = str.strip(t)
+    if t.endswith(" x"):
+        t = t[:-2]
+    if t.endswith(" ×"):
+        t = t[:-2]
+    if t.endswith("/"):
+        t = t[:-1]
+    return str.strip(t)
+
+
+# dim is tried at nearly every position of every grammar, so it's one regex
+# rather than the dozen pyparsing elements it was written as, which matched
+# the same strings by trying each piece in turn. Every quantifier in it is
+# possessive, so like pyparsing it never gives back what it has matched to
+# try something shorter, and no string can make it backtrack.
+space = r"[ \t\n\r]*+"
+# Longest first where one unit starts another
+dim_units = [
+    "inches",
+    "in",
+    '"',
+    "ft",
+    "'",
+    "cm",
+    "mm",
+    "minutes",
+    "m",
+    "gm",
+    "g",
+    "lbs",
+    "deg",
+    "seconds",
+    "pages",
+]
+dim_pattern = (
+    r"([0-9./ ½¼¾⅛⅜⅝⅞\-×]++)"  # value
+    rf"(?:{space}({'|'.join(map(re.escape, dim_units))})"  # unit
+    rf"(?:{space}(\.))?+"
+    rf"(?:{space}\(([A-Za-z. \[\],]++)\))?+"  # (context)
+    rf"(?:{space}([A-Za-z ]{{3,}}+))?+"  # context
+    r")?+"
+)
+# The "x" between dimensions, which may come before or after the comma
+# separating dimensions with contexts
+separator = r"x×*+"
+vol_dim_pattern = (
+    rf"{space}(?:{separator}{space})?+(?:,{space})?+{dim_pattern}"
+    rf"(?:{space}{separator})?+"
+)
+
+
+def dimension_from(
+    string: str, location: int, tokens: pp.ParseResults
+) -> pp.ParseResults:
+    """A dim_pattern match's value, unit and context tokens, named as dim names them."""
+    (value, unit, dot, bracketed, context) = tokens[0].groups()
+    value = extra_x_strip(value)
+    result = pp.ParseResults([value])
+    result["value"] = value
+    if unit is not None:
+        contexts = []
+        if bracketed is not None:
+            contexts.append(bracketed.strip())
+        if context is not None:
+            contexts.append(extra_x_strip(context))
+        result += pp.ParseResults([unit] + ([dot] if dot else []) + contexts)
+        result["unit"] = unit
+        result["context"] = pp.ParseResults(contexts)
+    return result
+
+
+@functools.cache
+def build() -> dict[str, pp.ParserElement]:
+    """Every grammar in grammar_elements by name, built on the first call."""
+    dim = pp.Group(
+        pp.Regex(dim_pattern, as_match=True)
+        .set_parse_action(dimension_from)
+        .set_name("dimension")
+    )
+    budgeted(dim)
+
+    vol = pp.Group(
+        pp.OneOrMore(
+            budgeted(
+                pp.Group(
+                    pp.Regex(vol_dim_pattern, as_match=True)
+                    .set_parse_action(dimension_from)
+                    .set_name("dimension")
+                )
+            )("dimensions*")
+        )
+    )
+    budgeted(vol)
+
+    dimensions = pp.Group(
+        pp.Optional(
+            pp.Group(
+                pp.Optional(
+                    pp.Combine(
+                        pp.Suppress("(")
+                        + pp.Word(
+                            pp.alphanums
+                            + pp.alphas8bit
+                            + "/"
+                            + "-"
+                            + "."
+                            + ";"
+                            + "&"
+                            + " "
+                        ).set_parse_action(pp.token_map(str.strip))
+                        + pp.Suppress(")")
+                    )
+                )
+                + pp.Word(
+                    pp.alphas + pp.alphas8bit + "/" + "-" + "&" + "?" + "'" + "#" + " "
+                ).set_parse_action(pp.token_map(str.strip))
+                + pp.Optional(
+                    pp.Suppress(";") + pp.Word(pp.alphas + pp.alphas8bit + "-")
+                )
+                + pp.Optional(
+                    pp.Suppress(",")
+                    + pp.Word(
+                        pp.alphas + pp.alphas8bit + "/" + "," + " "
+                    ).set_parse_action(pp.token_map(str.strip))
+                )
+                + pp.Optional(
+                    pp.Combine(
+                        pp.Suppress("(")
+                        + pp.Word(
+                            pp.alphanums
+                            + pp.alphas8bit
+                            + "/"
+                            + "-"
+                            + "."
+                            + ";"
+                            + "&"
+                            + " "
+                        ).set_parse_action(pp.token_map(str.strip))
+                        + pp.Suppress(")")
+                    )
+                )
+            )("type")
+        )
+        + pp.Suppress(pp.ZeroOrMore(":"))
+        + pp.OneOrMore(vol("measurements*") + pp.Suppress(pp.ZeroOrMore(";")))
+    )
+    budgeted(dimensions)
+
+    mimsy_string = (
+        pp.OneOrMore(dimensions("facets*"))
+        + pp.Suppress(pp.Optional("cm"))
+        + pp.Suppress(pp.Optional("Image:"))
+    )
+
+    dieaxis_string = pp.Group(
+        pp.Empty().addParseAction(pp.replace_with(["diexis"]))("type")
+        + pp.Group(dim("dimensions*"))("measurements*")
+        + pp.Suppress(";")
+        + pp.Group(dim("dimensions*"))("measurements*")
+        + pp.Suppress(",")
+        + pp.Suppress(pp.Literal("weight"))
+        + pp.Group(dim("dimensions*"))("measurements*")
+        + pp.Suppress(",")
+        + pp.Group(
+            pp.Suppress(
+                pp.Combine(
+                    pp.Literal("die")
+                    + pp.Optional(pp.Suppress(pp.White() + pp.Char("a")))
+                    + pp.Literal("xis")
+                    + pp.Optional(pp.Suppress(";"))
+                )
+            )
+            + dim("dimensions*")
+        )("measurements*")
+    )("facets*")
+
+    hdf_dimensions = pp.Group(
+        pp.Group(pp.Word(pp.alphas))("type")
+        + pp.Suppress(pp.Optional(":") + pp.Optional("-"))
+        + pp.OneOrMore(vol("measurements*") + pp.Suppress(pp.Optional(";")))
+    )
+    budgeted(hdf_dimensions)
+
+    hdf_string = pp.Suppress(pp.CaselessLiteral("overall:")) + pp.OneOrMore(
+        hdf_dimensions("facets*")
+    )
+
+    parenthetical_string = pp.Group(
+        pp.Optional(pp.Word(pp.alphas)("type*") + pp.Suppress(":"))
+        + vol("measurements*")
+        + pp.Suppress(pp.Optional("/"))
+        + pp.Suppress("(")
+        + pp.Optional(pp.Word(pp.alphas)("type*"))
+        + vol("measurements*")
+        + pp.Optional(pp.Word(pp.alphas)("type*"))
+        + pp.Suppress(")")
+    )("facets*")
+
+    straight_string = pp.Group(
+        pp.Group(
+            pp.Group(
+                pp.Word(pp.nums + " " + "/").add_parse_action(pp.token_map(str.strip))(
+                    "value"
+                )
+                + pp.Char('"')("unit")
+                + pp.Or([pp.Char("h"), pp.Char("H")])("context")
+            )("dimensions*")
+            + pp.Suppress("x")
+            + pp.Group(
+                pp.Word(pp.nums + " " + "/").add_parse_action(pp.token_map(str.strip))(
+                    "value"
+                )
+                + pp.Char('"')("unit")
+                + pp.Or([pp.Char("w"), pp.Char("W")])("context")
+            )("dimensions*")
+            + pp.Suppress("x")
+            + pp.Group(
+                pp.Word(pp.nums + " " + "/").add_parse_action(pp.token_map(str.strip))(
+                    "value"
+                )
+                + pp.Char('"')("unit")
+                + pp.Or([pp.Char("d"), pp.Char("D")])("context")
+            )("dimensions*")
+        )("measurements*")
+    )("facets*")
+
+    for grammar in [
+        mimsy_string,
+        dieaxis_string,
+        hdf_string,
+        parenthetical_string,
+        straight_string,
+    ]:
+        grammar.add_parse_action(facets_from)
+
+    return {
+        "dim": dim,
+        "vol": vol,
+        "dimensions": dimensions,
+        "mimsy_string": mimsy_string,
+        "dieaxis_string": dieaxis_string,
+        "hdf_dimensions": hdf_dimensions,
+        "hdf_string": hdf_string,
+        "parenthetical_string": parenthetical_string,
+        "straight_string": straight_string,
+    }
+
+
+@functools.cache
+def string_grammars() -> dict[str, pp.ParserElement]:
+    """The whole-string grammars by their grammar_names name, in that order."""
+    built = build()
+    return {name: built[f"{name}_string"] for name in grammar_names}
+
+
+def __getattr__(name: str):
+    if name in grammar_elements:
+        return build()[name]
+    if name == "grammars":
+        return string_grammars()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,125 @@
+"""What a MEASUREMENTS string parses into.
+
+Each string is a list of facets (an "Overall:" or "Sheet:" part), each facet
+has volumes (one set of measurements, in one system of units) and each volume
+its dimensions. The string grammars give these in place of ParseResults.
+"""
+
+import pyarrow as pa
+import pyparsing as pp
+
+
+class Model:
+    """Equality, repr and compact pickles from a class's __slots__."""
+
+    __slots__ = ()
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and self._values() == other._values()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        return (type(self), self._values())
+
+
+class Dimension(Model):
+    __slots__ = ("value", "unit", "context")
+
+    def __init__(
+        self,
+        value: str | None = None,
+        unit: str | None = None,
+        context: str | None = None,
+    ):
+        self.value = value
+        self.unit = unit
+        self.context = context
+
+
+class Volume(Model):
+    __slots__ = ("dimensions",)
+
+    def __init__(self, dimensions: list[Dimension]):
+        self.dimensions = dimensions
+
+
+class Facet(Model):
+    __slots__ = ("types", "volumes")
+
+    def __init__(self, types: list[str], volumes: list[Volume]):
+        self.types = types
+        self.volumes = volumes
+
+
+# Takes all three arguments so pyparsing doesn't have to work out how many
+# it wants on the first call, which isn't safe when partitions parse at once
+def facets_from(string: str, location: int, tokens: pp.ParseResults) -> list[Facet]:
+    """The facets a whole string grammar matched, in place of its ParseResults."""
+    return [
+        Facet(
+            list(f["type"]) if "type" in f else [],
+            (
+                [
+                    Volume(
+                        [
+                            Dimension(
+                                d["value"] if "value" in d else None,
+                                d["unit"] if "unit" in d else None,
+                                " ".join(d["context"]) if "context" in d else None,
+                            )
+                            for d in m["dimensions"]
+                        ]
+                    )
+                    for m in f["measurements"]
+                ]
+                if "measurements" in f
+                else []
+            ),
+        )
+        for f in tokens["facets"]
+    ]
+
+
+dimension_type = pa.struct(
+    [("value", pa.string()), ("unit", pa.string()), ("context", pa.string())]
+)
+facet_type = pa.struct(
+    [
+        ("types", pa.list_(pa.string())),
+        (
+            "volumes",
+            pa.list_(pa.struct([("dimensions", pa.list_(dimension_type))])),
+        ),
+    ]
+)
+
+
+def facets_to_arrow(records: list[list[Facet]]) -> pa.Array:
+    """A list of facets for each record, as one Arrow array."""
+    return pa.array(
+        [
+            [
+                {
+                    "types": f.types,
+                    "volumes": [
+                        {
+                            "dimensions": [
+                                {"value": d.value, "unit": d.unit, "context": d.context}
+                                for d in v.dimensions
+                            ]
+                        }
+                        for v in f.volumes
+                    ],
+                }
+                for f in facets
+            ]
+            for facets in records
+        ],
+        type=pa.list_(facet_type),
+    )
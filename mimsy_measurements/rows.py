@@ -0,0 +1,218 @@
+"""Flatten parsed strings into the rows of the export."""
+
+import heapq
+from time import perf_counter
+
+import polars as pl
+import pyparsing as pp
+
+from .compiled import compare_compiled, compiled_mimsy
+from .dispatch import Dispatch, dispatch, new_stats, tally
+from .fast import fast_path
+from .grammar import ParseTimeout, build, time_budget
+from .model import Facet
+
+schema = [
+    ("M_ID", pl.Int64),
+    ("MEASUREMENTS", pl.String),
+    # The string that was parsed, where cleaning changed it. A Parse
+    # Error's "at char" is a position in it, or in MEASUREMENTS if null
+    ("Cleaned MEASUREMENTS", pl.String),
+    ("Grammar", pl.String),
+    ("Parse Error", pl.String),
+    ("Parse Timeout", pl.Boolean),
+    ("Inconsistent Units", pl.Boolean),
+    ("Too Many Dimensions", pl.Boolean),
+    ("Missing Units", pl.Boolean),
+    ("Facet", pl.Int64),
+    ("Measurement", pl.Int64),
+    ("Type", pl.Categorical),
+    ("Type (additional)", pl.Categorical),
+    ("Units", pl.Categorical),
+    ("Dimension1 Context", pl.String),
+    ("Dimension1 Value", pl.String),
+    ("Dimension2 Context", pl.String),
+    ("Dimension2 Value", pl.String),
+    ("Dimension3 Context", pl.String),
+    ("Dimension3 Value", pl.String),
+    ("Dimension4 Context", pl.String),
+    ("Dimension4 Value", pl.String),
+    ("Dimension5 Context", pl.String),
+    ("Dimension5 Value", pl.String),
+]
+
+
+def rows_frame(rows: list[tuple]) -> pl.DataFrame:
+    """A batch DataFrame from (M_ID, MEASUREMENTS, cleaned, grammar, *parsed row) tuples."""
+    columns = list(zip(*rows)) or [()] * len(schema)
+    return pl.DataFrame(
+        [
+            pl.Series(name, values, dtype=dtype)
+            for ((name, dtype), values) in zip(schema, columns)
+        ]
+    )
+
+
+def flatten(facets: list[Facet], error: str | None = None) -> list[tuple]:
+    """Rows of the schema after Grammar for one parsed string."""
+    results = []
+    for facet, f in enumerate(facets):
+        type_ = f.types[0] if len(f.types) > 0 else None
+        type_additional = " ".join(f.types[1:]) if len(f.types) > 1 else None
+
+        if not f.volumes:
+            if type_ is not None:
+                results.append(
+                    (error, False, None, None, None)
+                    + (facet, None, type_, type_additional)
+                    + (None,) * 11
+                )
+            continue
+
+        too_many = len(f.volumes) > 5
+        for measurement, m in enumerate(f.volumes):
+            values = [None] * 10
+            units = set()
+            # Units usually only follow the last dimension, so one missing
+            # after a dimension that had them was probably left off
+            missing_units = False
+            for i, d in enumerate(m.dimensions):
+                if i < 5:
+                    values[2 * i] = d.context
+                    values[2 * i + 1] = d.value
+                if d.unit is not None:
+                    units.add(d.unit)
+                elif units:
+                    missing_units = True
+
+            results.append(
+                (
+                    error,
+                    False,
+                    len(units) > 1,
+                    too_many,
+                    missing_units,
+                    facet,
+                    measurement,
+                    type_,
+                    type_additional,
+                    ", ".join(units),
+                    *values,
+                )
+            )
+
+    return results
+
+
+def compare_fast_path(texts: list[str]) -> list[tuple]:
+    """(text, fast path rows, grammar rows) wherever the two disagree."""
+    mismatches = []
+    for text in texts:
+        fast = fast_path(text)
+        if fast is None:
+            continue
+        try:
+            rows = flatten(
+                list(build()["mimsy_string"].parse_string(text, parse_all=True))
+            )
+        except pp.ParseBaseException:
+            rows = None
+        if flatten(fast) != rows:
+            mismatches.append((text, flatten(fast), rows))
+    return mismatches
+
+
+def parse_record(
+    text: str,
+    fast_path_mode: str = "on",
+    budget: float | None = None,
+    max_length: int | None = None,
+    compiled_mode: str = "on",
+) -> tuple[Dispatch, list[tuple]]:
+    """How a string was parsed and its rows.
+
+    fast_path_mode and compiled_mode are as --fast-path and --compiled take
+    them. Strings longer than max_length aren't parsed, and ones the
+    grammars take more than budget seconds over are given up on, both as a
+    Parse Timeout.
+    """
+    if max_length and len(text) > max_length:
+        error = f"Parse Timeout: longer than {max_length} characters"
+        return (Dispatch(None, None, error, {}, True), timeout_rows(error))
+    if compiled_mode == "check":
+        for mismatch in compare_compiled([text]):
+            print("Compiled parser mismatch:", mismatch)
+
+    # The first string shouldn't spend its budget on building the grammars
+    build()
+    with time_budget(budget):
+        parsed = dispatch(
+            text,
+            use_fast_path=fast_path_mode != "off",
+            use_compiled=compiled_mode != "off",
+        )
+        if parsed.timed_out:
+            return (parsed, timeout_rows(parsed.error))
+        if parsed.grammar is not None:
+            if parsed.grammar == "fast" and fast_path_mode == "check":
+                for mismatch in compare_fast_path([text]):
+                    print("Fast path mismatch:", mismatch)
+            return (parsed, flatten(parsed.result))
+
+        # Keep whatever the default grammar can make of the start of the string
+        if compiled_mode != "off":
+            facets = compiled_mimsy(text, parse_all=False)
+        else:
+            try:
+                facets = list(build()["mimsy_string"].parse_string(text))
+            except ParseTimeout:
+                return (parsed._replace(timed_out=True), timeout_rows(parsed.error))
+            except pp.ParseException:
+                facets = None
+    if facets is None:
+        return (parsed, [(parsed.error, False) + (None,) * 18])
+    return (parsed, flatten(facets, parsed.error))
+
+
+def timeout_rows(error: str) -> list[tuple]:
+    return [(error, True) + (None,) * 18]
+
+
+def parse_chunk(
+    texts: list[str],
+    fast_path_mode: str = "on",
+    slowest: int = 0,
+    budget: float | None = None,
+    max_length: int | None = None,
+    compiled_mode: str = "on",
+) -> tuple[list[tuple[str, tuple]], dict, dict]:
+    """Each text with its (grammar, rows), the grammar stats and timings.
+
+    The timings are the seconds spent after the grammars, flattening and
+    re-parsing failed strings for what they start with, and the slowest
+    (seconds, text) pairs. The other arguments are parse_record's.
+    """
+    parsed_texts = []
+    stats = new_stats()
+    times = []
+    flatten_seconds = 0.0
+    for text in texts:
+        start = perf_counter()
+        (parsed, results) = parse_record(
+            text, fast_path_mode, budget, max_length, compiled_mode
+        )
+        seconds = perf_counter() - start
+        flatten_seconds += seconds - sum(parsed.seconds.values())
+        times.append((seconds, text))
+        tally(stats, parsed)
+        # The fast path reads only strings mimsy_string parses the same, so
+        # whether it was on doesn't change the export, only the stats
+        grammar = "mimsy" if parsed.grammar == "fast" else parsed.grammar
+        parsed_texts.append((text, (grammar, results)))
+    timings = {"flatten": flatten_seconds, "slowest": heapq.nlargest(slowest, times)}
+    return (parsed_texts, stats, timings)
+
+
+def chunked(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
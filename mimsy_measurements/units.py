@@ -0,0 +1,95 @@
+"""Dimension values as floats in one unit for each kind of measurement."""
+
+import polars as pl
+
+# What each unit dim recognizes is normalized to, and the factor to get there
+unit_conversions = {
+    "in": ("cm", 2.54),
+    '"': ("cm", 2.54),
+    "inches": ("cm", 2.54),
+    "ft": ("cm", 30.48),
+    "'": ("cm", 30.48),
+    "cm": ("cm", 1.0),
+    "m": ("cm", 100.0),
+    "mm": ("cm", 0.1),
+    "g": ("g", 1.0),
+    "gm": ("g", 1.0),
+    "lbs": ("g", 453.59237),
+    "deg": ("deg", 1.0),
+    "minutes": ("s", 60.0),
+    "seconds": ("s", 1.0),
+    "pages": ("pages", 1.0),
+}
+
+vulgar_fractions = {
+    "½": " 1/2",
+    "¼": " 1/4",
+    "¾": " 3/4",
+    "⅛": " 1/8",
+    "⅜": " 3/8",
+    "⅝": " 5/8",
+    "⅞": " 7/8",
+}
+
+
+def number(value: pl.Expr) -> pl.Expr:
+    """A value like "5 3/4", "19 ½", "11-1/4" or "15/16" as a float, null if it isn't one."""
+    parts = (
+        value.str.replace_many(list(vulgar_fractions), list(vulgar_fractions.values()))
+        .str.replace(r"(\d)-(\d+/\d+)$", "$1 $2")
+        .str.replace_all(r"\s+", " ")
+        .str.strip_chars()
+        .str.replace(r"^(\d+/\d+)$", "0 $1")
+        .str.extract_groups(
+            r"^(?P<whole>\d+(?:\.\d+)?|\.\d+)(?: (?P<numerator>\d+)/(?P<denominator>\d+))?$"
+        )
+    )
+    numerator = parts.struct["numerator"].cast(pl.Float64)
+    denominator = parts.struct["denominator"].cast(pl.Float64)
+    fraction = (
+        pl.when(denominator.is_null())
+        .then(0.0)
+        .when(denominator != 0)
+        .then(numerator / denominator)
+    )
+    return parts.struct["whole"].cast(pl.Float64) + fraction
+
+
+def normalize(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Add the dimension values as floats in the unit each kind is normalized to.
+
+    Rows with inconsistent units, or none, have no single factor to use, so
+    their values are left null and flagged like values that aren't numbers.
+    """
+    factor = (
+        pl.col("Units")
+        .cast(pl.String)
+        .replace_strict(
+            {unit: factor for (unit, (_, factor)) in unit_conversions.items()},
+            default=None,
+            return_dtype=pl.Float64,
+        )
+    )
+    return frame.with_columns(
+        pl.col("Units")
+        .cast(pl.String)
+        .replace_strict(
+            {unit: normal for (unit, (normal, _)) in unit_conversions.items()},
+            default=None,
+            return_dtype=pl.String,
+        )
+        .cast(pl.Categorical)
+        .alias("Normalized Units"),
+        *(
+            (number(pl.col(f"Dimension{n} Value")) * factor).alias(
+                f"Dimension{n} Value (normalized)"
+            )
+            for n in range(1, 6)
+        ),
+    ).with_columns(
+        pl.any_horizontal(
+            (pl.col(f"Dimension{n} Value").str.strip_chars() != "").fill_null(False)
+            & pl.col(f"Dimension{n} Value (normalized)").is_null()
+            for n in range(1, 6)
+        ).alias("Normalization Failed")
+    )